@@ -2,39 +2,43 @@
 This script downloads the competition result pages as HTML files for all competition links listed in 'data/links/comp_links.csv'.
 """
 
+import argparse
 import logging
 import os
 import time
 
 import pandas as pd
-import requests
-from file_paths import LINKS_PATH, LOG_PATH, RAW_DATA_PATH
-from tqdm import tqdm
+from file_paths import ARCHIVE_PATH, LINKS_PATH, LOG_PATH, RAW_DATA_PATH, RAW_STORAGE
+from utils.fetching import Fetcher, FetchJob, add_fetch_arguments
+from utils.profiling import RunReport, measure
+from utils.raw_store import open_raw_store
 
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
 
-def download_webpage(url, file_path):
+
+def build_download_job(url, file_path):
+    """
+    Create the competition directory (which keeps the download metadata and the link name mapping, also when the
+    pages are saved in the raw archive) and return the download job for its main results page.
+    """
     dir_name = url.split("/")[-2]
     file_path_full = os.path.join(file_path, dir_name)
     if not os.path.exists(file_path_full):
         os.makedirs(file_path_full)
 
-    if os.path.exists(os.path.join(file_path_full, f"{dir_name}.html")):
-        return
-
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+    return FetchJob(url, os.path.join(file_path_full, f"{dir_name}.html"), False)
 
-        with open(
-            os.path.join(file_path_full, f"{dir_name}.html"), "w", encoding="utf-8"
-        ) as file:
-            file.write(response.text)
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred: {e}")
+def download_webpage(url, file_path, fetcher=None):
+    fetcher = fetcher or Fetcher(workers=1, store=RAW_STORE)
+    return fetcher.fetch_all([build_download_job(url, file_path)], stage="01")
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_fetch_arguments(parser)
+    args = parser.parse_args()
+
     logging.basicConfig(
         filename=os.path.join(LOG_PATH, "01_download_main_page_to_html.log"),
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -42,12 +46,20 @@ def main():
         level=logging.INFO,
     )
 
+    report = RunReport(LOG_PATH, "01_download_main_page_to_html").install()
+
     start = time.time()
 
-    links = pd.read_csv(LINKS_PATH)
+    with measure("01"):
+        links = pd.read_csv(LINKS_PATH)
+
+        jobs = [
+            build_download_job(link, RAW_DATA_PATH) for link in links["links"].tolist()
+        ]
+
+        Fetcher.from_args(args, timeout=30, store=RAW_STORE).fetch_all(jobs, stage="01")
 
-    for link in tqdm(links["links"].tolist()):
-        download_webpage(link, RAW_DATA_PATH)
+    report.write()
 
     end = time.time()
     logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
@@ -3,6 +3,7 @@ For each downloaded competition result page in HTML, extract the table containin
 protocols, judges' information, etc., and create a mapping between the links and their descriptive names.
 """
 
+import argparse
 import json
 import logging
 import os
@@ -10,13 +11,26 @@ import time
 
 import pandas as pd
 from bs4 import BeautifulSoup
-from file_paths import LOG_PATH, RAW_DATA_PATH
+from file_paths import ARCHIVE_PATH, LOG_PATH, RAW_DATA_PATH, RAW_STORAGE
+from lxml import etree
 from tqdm import tqdm
+from utils.html_parsing import (
+    add_html_parser_arguments,
+    element_html,
+    element_text,
+    read_html,
+)
+from utils.profiling import RunReport, measure
+from utils.raw_store import open_raw_store
+
+LEAF_TABLES = etree.XPath("//table[not(.//table)]")
+
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
 
 
 def extract_table_from_html(file_path):
     soup = BeautifulSoup(
-        open(file_path, encoding="utf8"),
+        RAW_STORE.read_text(file_path),
         "html.parser",
     )
     tables = soup.find_all("table")
@@ -34,6 +48,24 @@ def extract_table_from_html(file_path):
     return tables[0]
 
 
+def extract_table_lxml(file_path):
+    """lxml version of extract_table_from_html: the leaf-level table with the starting orders, as an lxml element."""
+    tables = [
+        table
+        for table in LEAF_TABLES(read_html(file_path, RAW_STORE))
+        if "starting" in element_html(table).lower()
+    ]
+
+    if not tables:
+        raise ValueError(f"{file_path}: no table with the starting orders.")
+    if len(tables) > 1:
+        logging.warning(
+            f"{file_path}: {len(tables)} tables with the starting orders; using the first one."
+        )
+
+    return tables[0]
+
+
 def extract_texts_and_links(table):
     text_data = []
     link_data = []
@@ -54,6 +86,35 @@ def extract_texts_and_links(table):
         text_data.append(row_text_data)
         link_data.append(row_link_data)
 
+    return texts_and_links_to_dataframes(text_data, link_data)
+
+
+def extract_texts_and_links_lxml(table):
+    """lxml version of extract_texts_and_links."""
+    text_data = []
+    link_data = []
+    for row in table.iter("tr"):
+        row_text_data = []
+        row_link_data = []
+        for cell in row.iter("td"):
+            link = next(cell.iter("a"), None)
+            if link is not None:
+                row_link_data.append(link.attrib["href"])
+            else:
+                row_link_data.append(None)
+            text = element_text(cell)
+            if text != "":
+                row_text_data.append(text)
+            else:
+                row_text_data.append(None)
+
+        text_data.append(row_text_data)
+        link_data.append(row_link_data)
+
+    return texts_and_links_to_dataframes(text_data, link_data)
+
+
+def texts_and_links_to_dataframes(text_data, link_data):
     df_text = pd.DataFrame(text_data)
     df_text.ffill(inplace=True)
     df_text.fillna("", inplace=True)
@@ -91,7 +152,41 @@ def generate_link_name(df_text, df_link, file_path):
         json.dump(link_dict, json_file, indent=4)
 
 
+def read_texts_and_links(file_path, html_parser="lxml"):
+    """
+    The texts and links of the table with the starting orders, parsed with lxml or with BeautifulSoup's html.parser.
+    Pages that lxml fails on are parsed again with html.parser.
+    """
+    if html_parser == "lxml":
+        try:
+            return extract_texts_and_links_lxml(extract_table_lxml(file_path))
+        except ValueError:
+            # the page has no table with the starting orders, whichever the parser
+            raise
+        except Exception as e:
+            logging.warning(
+                f"{file_path}: lxml parsing failed ({e}); falling back to html.parser."
+            )
+    return extract_texts_and_links(extract_table_from_html(file_path))
+
+
+def build_link_name_mapping(dir_name, html_parser="lxml"):
+    folder_path = os.path.join(RAW_DATA_PATH, dir_name)
+    df_text, df_link = read_texts_and_links(
+        os.path.join(folder_path, f"{dir_name}.html"), html_parser
+    )
+    generate_link_name(
+        df_text,
+        df_link,
+        os.path.join(folder_path, "link_name_mapping.json"),
+    )
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_html_parser_arguments(parser)
+    args = parser.parse_args()
+
     logging.basicConfig(
         filename=os.path.join(LOG_PATH, "02_link_name_mapping.log"),
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -99,6 +194,8 @@ def main():
         level=logging.INFO,
     )
 
+    report = RunReport(LOG_PATH, "02_link_name_mapping").install()
+
     start = time.time()
 
     for dir_name in tqdm(os.listdir(RAW_DATA_PATH)):
@@ -108,18 +205,13 @@ def main():
             continue
 
         try:
-            table = extract_table_from_html(
-                os.path.join(folder_path, f"{dir_name}.html")
-            )
-            df_text, df_link = extract_texts_and_links(table)
-            generate_link_name(
-                df_text,
-                df_link,
-                os.path.join(folder_path, "link_name_mapping.json"),
-            )
+            with measure("02", dir_name):
+                build_link_name_mapping(dir_name, args.html_parser)
         except Exception as e:
             logging.error(f"Error processing {dir_name}: {e}")
 
+    report.write()
+
     end = time.time()
     logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
 
@@ -3,6 +3,7 @@ This script downloads detailed competition results, protocols and judges' inform
 created in the previous step. The files are saved as HTML or PDF in the respective competition directories.
 """
 
+import argparse
 import json
 import logging
 import os
@@ -10,15 +11,16 @@ import re
 import time
 
 import pandas as pd
-import requests
-from file_paths import LINKS_PATH, LOG_PATH, RAW_DATA_PATH
-from tqdm import tqdm
+from file_paths import ARCHIVE_PATH, LINKS_PATH, LOG_PATH, RAW_DATA_PATH, RAW_STORAGE
+from utils.fetching import Fetcher, FetchJob, add_fetch_arguments
+from utils.profiling import RunReport, measure
+from utils.raw_store import open_raw_store
 
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
 
-def download_html_or_pdf(root_url, url, dir_path):
-    if os.path.exists(os.path.join(dir_path, url)):
-        return
 
+def build_download_job(root_url, url, dir_path):
+    """Return the download job for one link."""
     if "/" in url:
         url = url.split("/")[-1]
 
@@ -30,18 +32,10 @@ def download_html_or_pdf(root_url, url, dir_path):
     else:
         url_path_full = root_url + "/" + url
 
-    response = requests.get(url_path_full, timeout=60)
-    response.raise_for_status()
-
-    if url.endswith("pdf"):
-        with open(os.path.join(dir_path, url), "wb") as pdf_file:
-            pdf_file.write(response.content)
-    else:
-        with open(os.path.join(dir_path, url), "w", encoding="utf-8") as file:
-            file.write(response.text)
+    return FetchJob(url_path_full, os.path.join(dir_path, url), url.endswith("pdf"))
 
 
-def download_all_results_for_one_competition(dir_name, root_url):
+def build_jobs_for_one_competition(dir_name, root_url):
     with open(
         os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json"),
         "r",
@@ -49,14 +43,24 @@ def download_all_results_for_one_competition(dir_name, root_url):
     ) as json_file:
         data = json.load(json_file)
 
-    for url in data.keys():
-        try:
-            download_html_or_pdf(root_url, url, os.path.join(RAW_DATA_PATH, dir_name))
-        except Exception as e:
-            logging.error(f"Error downloading {root_url} {url}: {e}")
+    return [
+        build_download_job(root_url, url, os.path.join(RAW_DATA_PATH, dir_name))
+        for url in data.keys()
+    ]
+
+
+def download_all_results_for_one_competition(dir_name, root_url, fetcher=None):
+    fetcher = fetcher or Fetcher(store=RAW_STORE)
+    return fetcher.fetch_all(
+        build_jobs_for_one_competition(dir_name, root_url), desc=dir_name, stage="03"
+    )
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_fetch_arguments(parser)
+    args = parser.parse_args()
+
     logging.basicConfig(
         filename=os.path.join(LOG_PATH, "03_download_results_to_html_or_pdf.log"),
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -64,6 +68,8 @@ def main():
         level=logging.INFO,
     )
 
+    report = RunReport(LOG_PATH, "03_download_results_to_html_or_pdf").install()
+
     start = time.time()
 
     link = pd.read_csv(LINKS_PATH)
@@ -72,12 +78,20 @@ def main():
     for _, row in link.iterrows():
         link_dict[row["comp"]] = row["links"]
 
-    for dir_name in tqdm(os.listdir(RAW_DATA_PATH)):
+    # queue the files of all competitions at once so that the workers are never idle
+    # waiting for a single competition to finish
+    jobs = []
+    for dir_name in os.listdir(RAW_DATA_PATH):
         root_url = link_dict[dir_name]
         if os.path.isfile(
             os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json")
         ):
-            download_all_results_for_one_competition(dir_name, root_url)
+            jobs += build_jobs_for_one_competition(dir_name, root_url)
+
+    with measure("03"):
+        Fetcher.from_args(args, store=RAW_STORE).fetch_all(jobs, stage="03")
+
+    report.write()
 
     end = time.time()
     logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
@@ -1,47 +1,111 @@
 """
 This script identifies HTML files that contain judge information based on the link_name_mapping.json files created in step 02,
-and extracts judge information for each competition and saves the it as pickled DataFrames in the respective competition directories.
+and extracts judge information for each competition and saves the it as Parquet (or pickled) DataFrames in the respective competition directories.
 """
 
+import argparse
+import hashlib
 import json
 import logging
 import os
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import StringIO
 
 import pandas as pd
+import utils.html_parsing as hp
 from bs4 import BeautifulSoup
-from file_paths import LOG_PATH, RAW_DATA_PATH
+from file_paths import (
+    ARCHIVE_PATH,
+    CACHE_PATH,
+    LOG_PATH,
+    OUTPUT_FORMAT,
+    RAW_DATA_PATH,
+    RAW_STORAGE,
+)
+from lxml import etree
 from tqdm import tqdm
+from utils.parallel import init_worker_logging, worker_log_queue
+from utils.parse_cache import ParseCache, source_version
+from utils.profiling import (
+    RunReport,
+    add_profiling_arguments,
+    measure,
+    profile_competition,
+)
+from utils.raw_store import open_raw_store
+from utils.storage import write_table
 
 RENAME_COLS = {"Nat.": "Nation"}
 
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
+
 DISCIPLINES = r"(?:men |women |ladies |pair |pairs |ice dance |ice dancing |synchronized skating )"
 PROGRAMS = r"(?:short program|rhythm dance|short dance|compulsory dance|original dance|free skating|free dance|qualifying.{0,30})$"
 
 
-def match_conditions(tag):
-    text = tag.get_text()
+def is_category(text):
     return re.search(DISCIPLINES, text, re.IGNORECASE) and re.search(
         PROGRAMS, text, re.IGNORECASE
     )
 
 
+def match_conditions(tag):
+    return is_category(tag.get_text())
+
+
+def is_judge_table(text):
+    return ("function" in text.lower()) and (text.lower() != "isu")
+
+
 def extract_one_table(dir_name, key):
     soup = BeautifulSoup(
-        open(os.path.join(RAW_DATA_PATH, dir_name, key), encoding="utf8"),
+        RAW_STORE.read_text(os.path.join(RAW_DATA_PATH, dir_name, key)),
         "html.parser",
     )
 
-    tables = soup.find_all("table")
+    tables = [table for table in soup.find_all("table") if is_judge_table(table.text)]
+
+    df = read_judge_table(str(tables[-1]), dir_name, key)
+    df["source"] = key
+    df["category"] = soup.body.find_all(match_conditions)[0].text.strip().lower()
+
+    return df
+
+
+def extract_one_table_lxml(dir_name, key):
+    """
+    lxml version of extract_one_table. The category is the text of the first element of the body (in document order)
+    that names a discipline and a program, so the search stops at the first match. The nested tables are flattened
+    before the judges' table is read (see utils.html_parsing.flatten_nested_tables).
+    """
+    tree = hp.read_html(os.path.join(RAW_DATA_PATH, dir_name, key), RAW_STORE)
+
     tables = [
-        table
-        for table in tables
-        if ("function" in table.text.lower()) and (table.text.lower() != "isu")
+        table for table in tree.iter("table") if is_judge_table(hp.element_text(table))
     ]
 
-    df = pd.read_html(StringIO(str(tables[-1])), header=0)[0]
+    category = None
+    for element in tree.body.iterdescendants(etree.Element):
+        text = hp.element_text(element)
+        if is_category(text):
+            category = text.strip().lower()
+            break
+    if category is None:
+        raise ValueError(f"No discipline and program found in {dir_name} - {key}.")
+
+    table = hp.flatten_nested_tables(tables[-1])
+    df = read_judge_table(hp.element_html(table), dir_name, key)
+    df["source"] = key
+    df["category"] = category
+
+    return df
+
+
+def read_judge_table(table_html, dir_name, key):
+    """Read the table of the judges (function, name and nation) from its HTML."""
+    df = pd.read_html(StringIO(table_html), header=0)[0]
     df.dropna(how="all", inplace=True, axis=0)
     df.rename(
         columns=RENAME_COLS,
@@ -54,13 +118,54 @@ def extract_one_table(dir_name, key):
             f"Unexpected columns found in {dir_name} - {key}. Please check the original file."
         )
 
-    df["source"] = key
-    df["category"] = soup.body.find_all(match_conditions)[0].text.strip().lower()
-
     return df
 
 
-def extract_judge_table(dir_name):
+def read_judge_page(dir_name, key, html_parser="lxml"):
+    """
+    The judges of one page, parsed with lxml or with BeautifulSoup's html.parser. Pages that lxml fails on are parsed
+    again with html.parser.
+    """
+    if html_parser == "lxml":
+        try:
+            return extract_one_table_lxml(dir_name, key)
+        except Exception as e:
+            logging.warning(
+                f"{dir_name} - {key}: lxml parsing failed ({e}); falling back to html.parser."
+            )
+    return extract_one_table(dir_name, key)
+
+
+def open_parse_cache(enabled=True):
+    """Cache of read_judge_page results; invalidated whenever the judge page parsing code changes."""
+    return ParseCache(
+        CACHE_PATH,
+        "judges",
+        source_version(
+            hp,
+            is_category,
+            match_conditions,
+            is_judge_table,
+            extract_one_table,
+            extract_one_table_lxml,
+            read_judge_table,
+            read_judge_page,
+        ),
+        enabled=enabled,
+        store=RAW_STORE,
+    )
+
+
+def is_judge_file(value):
+    """Check if the link name points to a page with the panel of judges."""
+    return "panel of judges" in value.lower() or "officials" in value.lower()
+
+
+def list_judge_files(dir_name, downloaded_only=True):
+    """
+    Return the file names of the downloaded judges' pages of a competition, in mapping order. With
+    downloaded_only=False, also the pages that are not downloaded yet (see run_streamed_results in pipeline.py).
+    """
     with open(
         os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json"),
         "r",
@@ -68,27 +173,133 @@ def extract_judge_table(dir_name):
     ) as json_file:
         data = json.load(json_file)
 
-    dfs = []
-    for key, value in data.items():
-        if "panel of judges" in value.lower() or "officials" in value.lower():
-            if not os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, key)):
-                continue
+    return [
+        key
+        for key, value in data.items()
+        if is_judge_file(value)
+        and (
+            not downloaded_only
+            or RAW_STORE.exists(os.path.join(RAW_DATA_PATH, dir_name, key))
+        )
+    ]
 
-            try:
-                df = extract_one_table(dir_name, key)
-            except Exception as e:
-                logging.error(f"Error processing {dir_name} - {key}: {e}")
-                continue
 
-            dfs.append(df)
+def read_judge_page_cached(dir_name, key, cache, html_parser="lxml", file_sha=None):
+    """
+    Return (judges, hit), reusing the cached judges if the page content and the parser are unchanged. Errors are
+    logged and give (None, False), so that the other pages of the competition are still saved.
+    """
+    try:
+        with measure("04", dir_name, key) as row:
+            if cache is None:
+                return read_judge_page(dir_name, key, html_parser), False
+            df, row["cache_hit"] = cache.cached(
+                os.path.join(RAW_DATA_PATH, dir_name, key),
+                (dir_name, key, html_parser),
+                read_judge_page,
+                dir_name,
+                key,
+                html_parser,
+                file_sha=file_sha,
+            )
+            return df, row["cache_hit"]
+    except Exception as e:
+        logging.error(f"Error processing {dir_name} - {key}: {e}")
+        return None, False
+
 
+def read_judge_page_streamed(dir_name, key, cache, html_parser, body):
+    """read_judge_page_cached for a page body straight from the downloads; a body of None is read from the store."""
+    if body is None:
+        return read_judge_page_cached(dir_name, key, cache, html_parser)
+    with RAW_STORE.streamed(os.path.join(RAW_DATA_PATH, dir_name, key), body):
+        return read_judge_page_cached(
+            dir_name, key, cache, html_parser, hashlib.sha256(body).hexdigest()
+        )
+
+
+def save_judges(dir_name, dfs):
+    """Concatenate the judges' pages of a competition (in mapping order) and save them."""
+    dfs = [df for df in dfs if df is not None]
     if len(dfs) > 0:
         df_final = pd.concat(dfs)
 
-        df_final.to_pickle(os.path.join(RAW_DATA_PATH, dir_name, "judges.pkl"))
+        write_table(
+            df_final, os.path.join(RAW_DATA_PATH, dir_name, "judges"), OUTPUT_FORMAT
+        )
+
+
+def extract_judge_table(dir_name, cache=None, html_parser="lxml"):
+    """Extract the judges of all pages of the given competition and save them."""
+    dfs = []
+    for key in list_judge_files(dir_name):
+        df, hit = read_judge_page_cached(dir_name, key, cache, html_parser)
+        if cache is not None and df is not None:
+            cache.record(hit)
+        dfs.append(df)
+    save_judges(dir_name, dfs)
+
+
+def extract_judge_tables_parallel(dir_names, workers, cache=None, html_parser="lxml"):
+    """
+    Extract the judges of all competitions with one process pool task per page. The judges of a competition are
+    saved as soon as all of its pages are done, in mapping order, so the output does not depend on completion order.
+    """
+    tasks = dict()
+    for dir_name in dir_names:
+        try:
+            tasks[dir_name] = list_judge_files(dir_name)
+        except Exception as e:
+            logging.error(f"Error processing {dir_name}: {e}")
+
+    with worker_log_queue() as queue, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker_logging, initargs=(queue,)
+    ) as executor:
+        futures = dict()
+        for dir_name, keys in tasks.items():
+            for index, key in enumerate(keys):
+                future = executor.submit(
+                    read_judge_page_cached, dir_name, key, cache, html_parser
+                )
+                futures[future] = (dir_name, index)
+
+        results = {dir_name: [None] * len(keys) for dir_name, keys in tasks.items()}
+        remaining = {dir_name: len(keys) for dir_name, keys in tasks.items()}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            dir_name, index = futures[future]
+            try:
+                results[dir_name][index], hit = future.result()
+                if cache is not None and results[dir_name][index] is not None:
+                    cache.record(hit)
+            except Exception as e:
+                logging.error(f"Error processing {dir_name}: {e}")
+
+            remaining[dir_name] -= 1
+            if remaining[dir_name] == 0:
+                try:
+                    save_judges(dir_name, results[dir_name])
+                except Exception as e:
+                    logging.error(f"Error processing {dir_name}: {e}")
+                del results[dir_name]
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="re-parse every page instead of reusing the cached results of unchanged files",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes; with more than one, the pages are parsed in parallel",
+    )
+    hp.add_html_parser_arguments(parser)
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+
     logging.basicConfig(
         filename=os.path.join(LOG_PATH, "04_judge_scraping.log"),
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -96,17 +307,35 @@ def main():
         level=logging.INFO,
     )
 
+    report = RunReport(LOG_PATH, "04_judge_scraping").install()
+
     start = time.time()
 
-    for dir_name in tqdm(os.listdir(RAW_DATA_PATH)):
+    cache = open_parse_cache(enabled=not args.no_cache)
+
+    dir_names = [
+        dir_name
+        for dir_name in (
+            [args.profile_comp] if args.profile_comp else os.listdir(RAW_DATA_PATH)
+        )
         if os.path.isfile(
             os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json")
-        ):
-            try:
-                extract_judge_table(dir_name)
-            except Exception as e:
-                logging.error(f"Error processing {dir_name}: {e}")
-                continue
+        )
+    ]
+
+    if args.workers > 1 and not args.profile_comp:
+        extract_judge_tables_parallel(dir_names, args.workers, cache, args.html_parser)
+    else:
+        with profile_competition(args, LOG_PATH, "04_judge_scraping"):
+            for dir_name in tqdm(dir_names):
+                try:
+                    with measure("04", dir_name):
+                        extract_judge_table(dir_name, cache, args.html_parser)
+                except Exception as e:
+                    logging.error(f"Error processing {dir_name}: {e}")
+
+    cache.log_stats()
+    report.write()
 
     end = time.time()
     logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
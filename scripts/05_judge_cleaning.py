@@ -2,16 +2,27 @@
 This script appends the judge information from all competitions and cleans the data.
 """
 
+import logging
 import os
 import re
 
+import numpy as np
 import pandas as pd
-from file_paths import CLEANED_DATA_PATH, RAW_DATA_PATH
+from file_paths import CLEANED_DATA_PATH, LOG_PATH, OUTPUT_FORMAT, RAW_DATA_PATH
 from utils.cleaning import (
-    extract_comp_type_season,
-    extract_discipline,
-    extract_program,
-    generate_junior_indicator,
+    extract_comp_type_season_series,
+    extract_discipline_series,
+    extract_program_series,
+    generate_junior_indicator_series,
+    map_unique,
+)
+from utils.profiling import RunReport, measure
+from utils.storage import (
+    read_cleaned,
+    read_table,
+    replace_competition,
+    table_exists,
+    write_cleaned,
 )
 
 
@@ -22,6 +33,21 @@ def get_gender(name):
         return "F"
 
 
+def get_gender_series(name):
+    """Vectorized get_gender."""
+    return pd.Series(
+        np.select(
+            [
+                name.str.contains(r"Mr(?:\.|\s)", regex=True, na=False),
+                name.str.contains(r"(?:Ms|Mrs)(?:\.|\s)", regex=True, na=False),
+            ],
+            ["M", "F"],
+            default=None,
+        ),
+        index=name.index,
+    )
+
+
 def first_name_first(name):
     ### manual adjustment for two names
     if name == "van VEEN Wilhelmina":
@@ -40,56 +66,73 @@ def first_name_first(name):
     return " ".join(first_name + last_name)
 
 
-def main():
-    ### append all files
+def load_raw_judges(dir_names, columns=None):
+    """Append the judges' tables of the given competitions, or None if there are none."""
     dfs = []
-    for dir_name in os.listdir(RAW_DATA_PATH):
-        if os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, "judges.pkl")):
-            df = pd.read_pickle(os.path.join(RAW_DATA_PATH, dir_name, "judges.pkl"))
+    for dir_name in dir_names:
+        if table_exists(os.path.join(RAW_DATA_PATH, dir_name, "judges")):
+            df = read_table(os.path.join(RAW_DATA_PATH, dir_name, "judges"), columns)
             if not df.empty:
                 df["comp"] = dir_name
                 dfs.append(df)
 
-    df = pd.concat(dfs, ignore_index=True)
+    return pd.concat(dfs, ignore_index=True) if dfs else None
 
-    ### clean data, extract gender from name
-    df["gender"] = df["Name"].apply(get_gender)
+
+def clean_names_and_nations(df):
     df["Name"] = df["Name"].str.replace(r"\s", " ", regex=True)
     df["Name"] = df["Name"].str.replace(r"^(Ms|Mrs|Mr)(\.\s|\s)", "", regex=True)
     df["Name"] = df["Name"].str.replace(r"(\.)", "", regex=True)
-    df["Name"] = df["Name"].apply(first_name_first)
-
-    ### get judge id, clean functions
-    df["judge_id"] = df["Function"].str.extract(r"Judge No.(\d+)")
-    df["judge_id"] = df["judge_id"].apply(lambda x: "j" + x if pd.notna(x) else x)
-    df["Function"] = df["Function"].str.replace(r" No.\d+", "", regex=True)
+    df["Name"] = map_unique(df["Name"], first_name_first)
 
     ### replace nation as RUS if the nation is OAR (olympic athlete from Russia)
-    df["Nation"] = df["Nation"].apply(lambda x: "RUS" if x in ("OAR", "ROC") else x)
+    df["Nation"] = df["Nation"].replace({"OAR": "RUS", "ROC": "RUS"})
+    return df
 
-    ### the judge nation is missing for some competitions; for those cases, try to get the
-    ### judge's nation based on the nation information from other competitions for the same judge
+
+def nation_lookup(df):
+    """The nation of every judge listed with a single nation (other than ISU) across all competitions."""
     df_name = df[df["Nation"] != "ISU"][["Name", "Nation"]].drop_duplicates()
     df_name["count"] = df_name.groupby("Name")["Nation"].transform("count")
     df_name = df_name[df_name["count"] == 1][["Name", "Nation"]]
 
-    df_name.rename(columns={"Nation": "Nation2"}, inplace=True)
+    return df_name.rename(columns={"Nation": "Nation2"})
+
+
+def add_nation2(df, df_name):
+    ### the judge nation is missing for some competitions; for those cases, try to get the
+    ### judge's nation based on the nation information from other competitions for the same judge
     df = df.merge(df_name, on="Name", how="left")
-    df["Nation2"] = df.apply(
-        lambda row: (
-            row["Nation"]
-            if (row["Nation"] != "ISU") and pd.isna(row["Nation2"])
-            else row["Nation2"]
-        ),
-        axis=1,
+    df["Nation2"] = df["Nation2"].mask(
+        (df["Nation"] != "ISU") & df["Nation2"].isna(), df["Nation"]
     )
+    return df
+
+
+def clean_judge_rows(df, df_name=None):
+    """
+    Clean the appended judges' tables. Missing nations are looked up in df_name (see nation_lookup), by default
+    built from the same tables.
+    """
+    ### clean data, extract gender from name
+    df["gender"] = get_gender_series(df["Name"])
+    df = clean_names_and_nations(df)
+    if df_name is None:
+        df_name = nation_lookup(df)
+
+    ### get judge id, clean functions
+    df["judge_id"] = df["Function"].str.extract(r"Judge No.(\d+)")
+    df["judge_id"] = "j" + df["judge_id"]
+    df["Function"] = df["Function"].str.replace(r" No.\d+", "", regex=True)
+
+    df = add_nation2(df, df_name)
 
     ### check how many judges are assigned nationality
     df_judge = df[df["Function"] == "Judge"].copy()
 
     ### generate other columns; clean up the data
-    df_judge["comp_type"], df_judge["year"], df_judge["season"] = zip(
-        *df_judge["comp"].apply(extract_comp_type_season)
+    df_judge["comp_type"], df_judge["year"], df_judge["season"] = (
+        extract_comp_type_season_series(df_judge["comp"])
     )
 
     df_judge["category"] = df_judge["category"].str.lower()
@@ -99,18 +142,91 @@ def main():
         )
     ]
 
-    df_judge["discipline"] = df_judge["category"].apply(extract_discipline)
-    df_judge["program"] = df_judge.apply(
-        lambda row: extract_program(row["category"], row["source"]), axis=1
+    df_judge["discipline"] = extract_discipline_series(df_judge["category"])
+    df_judge["program"] = extract_program_series(
+        df_judge["category"], df_judge["source"]
+    )
+
+    df_judge["junior"] = generate_junior_indicator_series(
+        df_judge["category"], df_judge["comp_type"]
+    )
+
+    df_judge["team"] = (
+        df_judge["category"].str.lower().str.contains("team", regex=False)
+    )
+
+    return df_judge
+
+
+def clean_judges():
+    ### append all files
+    df = load_raw_judges(os.listdir(RAW_DATA_PATH))
+    df_judge = clean_judge_rows(df)
+
+    write_cleaned(df_judge, "judges", CLEANED_DATA_PATH, OUTPUT_FORMAT)
+
+
+def stale_nation_competitions(df_name):
+    """The competitions of the cleaned judges whose imputed nations (Nation2) differ with the given lookup."""
+    df = read_cleaned(
+        "judges", CLEANED_DATA_PATH, columns=["comp", "Name", "Nation", "Nation2"]
+    )
+    df = df.astype(object)
+    new_nation2 = add_nation2(df.drop(columns="Nation2"), df_name)["Nation2"]
+    unchanged = (df["Nation2"] == new_nation2) | (
+        df["Nation2"].isna() & new_nation2.isna()
     )
+    return set(df.loc[~unchanged, "comp"])
+
+
+def patch_judges(comps):
+    """
+    Clean the judges of the given competitions only and replace their files in the partitioned dataset, leaving the
+    other competitions as they are. The nations imputed from other competitions (Nation2) are looked up in all
+    competitions, as in clean_judges, and the competitions whose imputed nations change are cleaned again as well,
+    so that the result is the same as that of clean_judges. Falls back to clean_judges for the pickle output or if
+    there is no cleaned dataset yet.
+    """
+    root = os.path.join(CLEANED_DATA_PATH, "judges")
+    if OUTPUT_FORMAT != "parquet" or not os.path.isdir(root):
+        clean_judges()
+        return
+
+    df_names = load_raw_judges(os.listdir(RAW_DATA_PATH), columns=["Name", "Nation"])
+    df_name = nation_lookup(clean_names_and_nations(df_names))
+
+    stale = stale_nation_competitions(df_name) - set(comps)
+    if stale:
+        logging.info(
+            f"Imputed nations changed for {len(stale)} other competitions: {sorted(stale)}"
+        )
+    comps = sorted(set(comps) | stale)
+
+    df = load_raw_judges(comps)
+    df_judge = (
+        clean_judge_rows(df, df_name)
+        if df is not None
+        else pd.DataFrame(columns=["comp"])
+    )
+    for comp in comps:
+        replace_competition(df_judge[df_judge["comp"] == comp], root, comp)
+    logging.info(f"Cleaned the judges of {len(comps)} competitions.")
 
-    df_judge["junior"] = df_judge.apply(
-        lambda row: generate_junior_indicator(row["category"], row["comp_type"]), axis=1
+
+def main():
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "05_judge_cleaning.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
     )
 
-    df_judge["team"] = df_judge["category"].apply(lambda x: "team" in x.lower())
+    report = RunReport(LOG_PATH, "05_judge_cleaning").install()
+
+    with measure("05"):
+        clean_judges()
 
-    df_judge.to_pickle(os.path.join(CLEANED_DATA_PATH, "judges.pkl"))
+    report.write()
 
 
 if __name__ == "__main__":
@@ -1,24 +1,61 @@
 """
 This script extracts detailed judge-element-level scores from the downloaded protocols (in PDF) for each competition
-and saves the it as pickled DataFrames in the respective competition directories.
+and saves the it as Parquet (or pickled) DataFrames in the respective competition directories.
 """
 
+import argparse
+import hashlib
 import json
 import logging
 import os
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-import fitz
 import pandas as pd
 import utils.pdf_scraping as ut
-from file_paths import LOG_PATH, RAW_DATA_PATH
+from file_paths import (
+    ARCHIVE_PATH,
+    CACHE_PATH,
+    LOG_PATH,
+    OUTPUT_FORMAT,
+    RAW_DATA_PATH,
+    RAW_STORAGE,
+)
 from tqdm import tqdm
 from utils.cleaning import extract_comp_type_season
+from utils.parallel import init_worker_logging, worker_log_queue
+from utils.parse_cache import ParseCache, source_version
+from utils.profiling import (
+    RunReport,
+    add_profiling_arguments,
+    measure,
+    profile_competition,
+)
+from utils.raw_store import open_raw_store
+from utils.storage import write_table
 
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
 
-def extract_all_protocols(dir_name, season):
-    """Extract all protocols from the given directory and save them as a pickle file."""
+
+def is_protocol_file(key, value):
+    """Check if the link points to a protocol (judges' scores) PDF that should be extracted."""
+    return (
+        key.endswith(".pdf")
+        and ("score" in value.lower())
+        and ("qualifying" not in key.lower())
+        and ("synchronized" not in key.lower())
+        and ("_qa_" not in key.lower())
+        and ("_qb_" not in key.lower())
+        and ("preliminaryround" not in key.lower())
+    )
+
+
+def list_protocol_files(dir_name, downloaded_only=True):
+    """
+    Return the (file name, link name) pairs of the downloaded protocols of a competition, in mapping order. With
+    downloaded_only=False, also the protocols that are not downloaded yet (see run_streamed_results in pipeline.py).
+    """
     with open(
         os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json"),
         "r",
@@ -26,68 +63,245 @@ def extract_all_protocols(dir_name, season):
     ) as json_file:
         data = json.load(json_file)
 
-    df_disciplines = []
-    for key, value in data.items():
-        if (
-            key.endswith(".pdf")
-            and ("score" in value.lower())
-            and ("qualifying" not in key.lower())
-            and ("synchronized" not in key.lower())
-            and ("_qa_" not in key.lower())
-            and ("_qb_" not in key.lower())
-            and ("preliminaryround" not in key.lower())
-        ):
-            if not os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, key)):
-                continue
-
-            doc = fitz.open(os.path.join(RAW_DATA_PATH, dir_name, key))
-
-            # check if the first page is protocol
-            if (not "nation" in doc[0].get_text(sort=True).lower()) and (
-                not "noc" in doc[0].get_text(sort=True).lower()
-            ):
-                doc = doc[1:]  # skip the first page if it is not a protocol
-
-            skaters = ut.get_results_all_pages(doc, dir_name, season)
-
-            # convert skaters to dataframes
-            dfs = []
-            for skater in skaters:
-                if skater:
-                    skater_result = ut.Skater(skater, dir_name, key, season)
-                    df = skater_result.to_dataframe()
-                    dfs.append(df)
-
-            # append results, add category and source
-            if len(dfs) > 0:
-                df = pd.concat(dfs, ignore_index=True)
-
-                if re.search(r"j?gp", dir_name) and season == 2004:
-                    df["category"] = value
-                else:
-                    try:
-                        df["category"] = re.findall(
-                            r"\b(.*(?:men |women |ladies |pair |pairs |ice dance |ice dancing |synchronized skating ).{0,20}?)(?:\n\n|\s\s)",
-                            doc[0].get_text(sort=True).strip().lower(),
-                        )[0]
-                    except:
-                        df["category"] = value
-
-                df["source"] = key
-
-                df_disciplines.append(df)
-            else:
-                logging.warning(
-                    f"No skaters found in {key} in {dir_name}. Skipping this file."
-                )
+    return [
+        (key, value)
+        for key, value in data.items()
+        if is_protocol_file(key, value)
+        and (
+            not downloaded_only
+            or RAW_STORE.exists(os.path.join(RAW_DATA_PATH, dir_name, key))
+        )
+    ]
+
+
+def open_protocol(file_path):
+    """
+    Open a protocol PDF, skipping the first page if it is not part of the protocol. The pages are read through a
+    PageTextCache, so the first page is only extracted once for this check, the category and the parser. PDFs in the
+    raw archive are opened from their bytes, without a temporary file.
+    """
+    doc = ut.CachedDocument(RAW_STORE.open_pdf(file_path))
+
+    # check if the first page is protocol
+    first_page = doc[0].get_text(sort=True).lower()
+    if ("nation" not in first_page) and ("noc" not in first_page):
+        doc = doc[1:]  # skip the first page if it is not a protocol
+
+    return doc
+
+
+def protocol_category(doc, dir_name, season, value):
+    """The category of the protocol (e.g. "men short program"), from its first page or else from the link name."""
+    if re.search(r"j?gp", dir_name) and season == 2004:
+        return value
+    try:
+        return re.findall(
+            r"\b(.*(?:men |women |ladies |pair |pairs |ice dance |ice dancing |synchronized skating ).{0,20}?)(?:\n\n|\s\s)",
+            doc[0].get_text(sort=True).strip().lower(),
+        )[0]
+    except:
+        return value
+
+
+def extract_one_protocol(dir_name, key, value, season, engine="text", stats=None):
+    """
+    Extract the protocol of one PDF as a DataFrame, or None if no skaters are found. The engine selects how the
+    table is extracted (see utils.pdf_scraping.get_results_all_pages). The page text cache hits and misses are added
+    to the stats dict if given.
+    """
+    doc = open_protocol(os.path.join(RAW_DATA_PATH, dir_name, key))
+
+    # the category is read first, while the first page is still in the page text cache
+    category = protocol_category(doc, dir_name, season, value)
+
+    # convert skaters to compact rows as the pages are read, and to a single DataFrame at the end
+    rows = [
+        skater.to_rows()
+        for skater in ut.iter_skaters(doc, dir_name, key, season, engine)
+    ]
+
+    if stats is not None:
+        stats["page_text_hits"] = doc.cache.hits
+        stats["page_text_misses"] = doc.cache.misses
+
+    # add category and source
+    if len(rows) == 0:
+        logging.warning(f"No skaters found in {key} in {dir_name}. Skipping this file.")
+        return None
+
+    df = ut.rows_to_dataframe(rows)
+    df["category"] = category
+    df["source"] = key
+
+    return df
+
+
+def open_parse_cache(enabled=True):
+    """Cache of extract_one_protocol results; invalidated whenever the PDF parsing code changes."""
+    return ParseCache(
+        CACHE_PATH,
+        "protocols",
+        source_version(
+            ut, is_protocol_file, open_protocol, protocol_category, extract_one_protocol
+        ),
+        enabled=enabled,
+        store=RAW_STORE,
+    )
+
+
+def extract_one_protocol_cached(
+    dir_name, key, value, season, cache, engine="text", file_sha=None
+):
+    """Return (protocol, hit), reusing the cached protocol if the PDF content and the parser are unchanged."""
+    with measure("06", dir_name, key) as row:
+        if cache is None:
+            return (
+                extract_one_protocol(dir_name, key, value, season, engine, row),
+                False,
+            )
+        df, row["cache_hit"] = cache.cached(
+            os.path.join(RAW_DATA_PATH, dir_name, key),
+            (dir_name, key, value, season, engine),
+            extract_one_protocol,
+            dir_name,
+            key,
+            value,
+            season,
+            engine,
+            row,
+            file_sha=file_sha,
+        )
+        return df, row["cache_hit"]
+
 
+def extract_one_protocol_streamed(dir_name, key, value, season, cache, engine, body):
+    """extract_one_protocol_cached for a PDF body straight from the downloads; a body of None is read from the store."""
+    if body is None:
+        return extract_one_protocol_cached(dir_name, key, value, season, cache, engine)
+    with RAW_STORE.streamed(os.path.join(RAW_DATA_PATH, dir_name, key), body):
+        return extract_one_protocol_cached(
+            dir_name,
+            key,
+            value,
+            season,
+            cache,
+            engine,
+            hashlib.sha256(body).hexdigest(),
+        )
+
+
+def save_protocols(dir_name, df_disciplines):
+    """Concatenate the protocols of a competition (in mapping order) and save them."""
+    df_disciplines = [df for df in df_disciplines if df is not None]
     if len(df_disciplines) > 0:
         df_final = pd.concat(df_disciplines)
 
-        df_final.to_pickle(os.path.join(RAW_DATA_PATH, dir_name, "protocols.pkl"))
+        write_table(
+            df_final,
+            os.path.join(RAW_DATA_PATH, dir_name, "protocols"),
+            OUTPUT_FORMAT,
+        )
+
+
+def extract_all_protocols(dir_name, season, cache=None, engine="text"):
+    """Extract all protocols from the given directory and save them."""
+    df_disciplines = []
+    for key, value in list_protocol_files(dir_name):
+        df, hit = extract_one_protocol_cached(
+            dir_name, key, value, season, cache, engine
+        )
+        if cache is not None:
+            cache.record(hit)
+        df_disciplines.append(df)
+    save_protocols(dir_name, df_disciplines)
+
+
+def extract_all_protocols_parallel(dir_names, workers, cache=None, engine="text"):
+    """
+    Extract the protocols of all competitions with one process pool task per PDF. The results of a competition are
+    saved as soon as all of its PDFs are done, in mapping order, so the output does not depend on completion order.
+    """
+    tasks = dict()
+    for dir_name in dir_names:
+        _, _, season = extract_comp_type_season(dir_name)
+        try:
+            tasks[dir_name] = [
+                (key, value, season) for key, value in list_protocol_files(dir_name)
+            ]
+        except Exception as e:
+            logging.error(f"Error processing {dir_name}: {e}")
+
+    with worker_log_queue() as queue, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker_logging, initargs=(queue,)
+    ) as executor:
+        futures = dict()
+        for dir_name, files in tasks.items():
+            for index, (key, value, season) in enumerate(files):
+                future = executor.submit(
+                    extract_one_protocol_cached,
+                    dir_name,
+                    key,
+                    value,
+                    season,
+                    cache,
+                    engine,
+                )
+                futures[future] = (dir_name, index)
+
+        results = {dir_name: [None] * len(files) for dir_name, files in tasks.items()}
+        remaining = {dir_name: len(files) for dir_name, files in tasks.items()}
+        failed = set()
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            dir_name, index = futures[future]
+            try:
+                results[dir_name][index], hit = future.result()
+                if cache is not None:
+                    cache.record(hit)
+            except Exception as e:
+                if dir_name not in failed:
+                    logging.error(f"Error processing {dir_name}: {e}")
+                failed.add(dir_name)
+
+            remaining[dir_name] -= 1
+            if remaining[dir_name] == 0:
+                if dir_name not in failed:
+                    save_protocols(dir_name, results[dir_name])
+                del results[dir_name]
+
+
+def log_page_text_stats(rows):
+    """Log the page text cache hits and misses of the protocols extracted in this run, from the run report rows."""
+    hits = sum(row.get("page_text_hits", 0) for row in rows)
+    misses = sum(row.get("page_text_misses", 0) for row in rows)
+    total = hits + misses
+    logging.info(
+        f"Page text cache: {hits} hits, {misses} misses ({hits / total if total else 0:.1%} hit rate); "
+        "each miss is one page text extraction."
+    )
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes; with more than one, PDFs are extracted in parallel",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="re-parse every PDF instead of reusing the cached results of unchanged files",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ut.ENGINES,
+        default="text",
+        help="table extraction: columns split at runs of spaces in the page text, or columns from the word boxes",
+    )
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+
     logging.basicConfig(
         filename=os.path.join(LOG_PATH, "06_protocol_pdf_scraping.log"),
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -95,17 +309,37 @@ def main():
         level=logging.INFO,
     )
 
+    report = RunReport(LOG_PATH, "06_protocol_pdf_scraping").install()
+
     start = time.time()
 
-    for dir_name in tqdm(os.listdir(RAW_DATA_PATH)):
+    dir_names = [
+        dir_name
+        for dir_name in (
+            [args.profile_comp] if args.profile_comp else os.listdir(RAW_DATA_PATH)
+        )
         if os.path.isfile(
             os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json")
-        ):
-            _, _, season = extract_comp_type_season(dir_name)
-            try:
-                extract_all_protocols(dir_name, season)
-            except Exception as e:
-                logging.error(f"Error processing {dir_name}: {e}")
+        )
+    ]
+
+    cache = open_parse_cache(enabled=not args.no_cache)
+
+    if args.workers > 1 and not args.profile_comp:
+        extract_all_protocols_parallel(dir_names, args.workers, cache, args.engine)
+    else:
+        with profile_competition(args, LOG_PATH, "06_protocol_pdf_scraping"):
+            for dir_name in tqdm(dir_names):
+                _, _, season = extract_comp_type_season(dir_name)
+                try:
+                    with measure("06", dir_name):
+                        extract_all_protocols(dir_name, season, cache, args.engine)
+                except Exception as e:
+                    logging.error(f"Error processing {dir_name}: {e}")
+
+    cache.log_stats()
+    log_page_text_stats(report.rows)
+    report.write()
 
     end = time.time()
     logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
@@ -2,18 +2,110 @@
 This script appends the detailed judge-element-level scores from all competitions and cleans the data.
 """
 
+import argparse
+import hashlib
+import json
+import logging
 import os
 import re
+import shutil
+from collections import Counter
 
 import numpy as np
 import pandas as pd
-from file_paths import CLEANED_DATA_PATH, RAW_DATA_PATH
+from file_paths import CLEANED_DATA_PATH, LOG_PATH, OUTPUT_FORMAT, RAW_DATA_PATH
+from tqdm import tqdm
 from utils.cleaning import (
-    extract_comp_type_season,
-    extract_discipline,
-    extract_program,
-    generate_junior_indicator,
+    apply_schema,
+    extract_comp_type_season_series,
+    extract_discipline_series,
+    extract_program_series,
+    generate_junior_indicator_series,
 )
+from utils.hashing import sha256_of_file
+from utils.profiling import RunReport, measure
+from utils.storage import (
+    read_table,
+    remove_competition,
+    replace_competition,
+    table_exists,
+    table_file,
+    write_cleaned,
+)
+
+MANIFEST_FILE_NAME = "_manifest.json"
+
+# The schema of the cleaned protocols (one row per judge score), in column order. Strings repeated on every row are
+# categoricals, and the integers and the judges' scores use the narrowest dtype that holds every value without loss.
+# The amounts with two decimals (base value, GOE, panel score, factor, segment scores) are not exact in float32 and
+# stay float64, as does the standardized score.
+CLEANED_SCHEMA = {
+    "element_order": "Int8",  # 1, 2, ... for the elements; missing for the components
+    "element": "category",  # element code (e.g. 3Lz+3T) or component name
+    "base_value": "float64",
+    "goe": "float64",
+    "panel_score": "float64",
+    "marks": "category",  # e.g. <, << or e next to the element
+    "second_half": "category",  # x for the elements in the second half of the program
+    "component": "category",  # TES or PCS
+    "factor": "float64",
+    "rank": "Int16",
+    "name": "category",
+    "nation": "category",
+    "stn": "Int16",  # starting number; missing before 2009
+    "tss": "float64",
+    "tes": "float64",
+    "pcs": "float64",
+    "deductions": "float64",
+    "category": "category",
+    "source": "category",
+    "comp": "category",
+    "discipline": "category",
+    "program": "category",
+    "comp_type": "category",
+    "year": "int16",
+    "season": "int16",
+    "junior": "bool",
+    "team": "bool",
+    "judge_id": "category",
+    "judge_score": "float32",  # GOE and component marks, in steps of 0.25 at most
+    "judge_score_std": "float64",
+}
+
+CLEANED_COLUMNS = list(CLEANED_SCHEMA)
+
+SCHEMA_VERSION = hashlib.sha256(json.dumps(CLEANED_SCHEMA).encode()).hexdigest()[:16]
+
+
+def standardize_by_group(df, keys, col):
+    """
+    Standardize col within the groups defined by keys, with the same semantics as
+    groupby(keys, dropna=False)[col].transform(standardize_score): population std (ddof=0), missing values ignored
+    and kept missing, and 0 for every non-missing value of a group whose values are all equal.
+
+    Instead of a Python callback per group, the group means and variances are computed with segment sums
+    (np.bincount) over the group codes. A constant group is detected by comparing its values with one of them rather
+    than by its std, since the segment sum mean of e.g. nine marks of 0.1 is not exact and leaves a tiny nonzero std.
+    """
+    codes = (
+        df.groupby(keys, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    )
+    x = df[col].to_numpy(dtype=float)
+    valid = ~np.isnan(x)
+    x_valid = np.where(valid, x, 0.0)
+
+    counts = np.bincount(codes, weights=valid)
+    # one value of every group, and whether all the values of the group equal it
+    first = np.zeros(len(counts))
+    first[codes[valid]] = x[valid]
+    constant = np.bincount(codes, weights=valid & (x != first[codes])) == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(codes, weights=x_valid) / counts
+        dev = np.where(valid, x - mean[codes], 0.0)
+        std = np.sqrt(np.bincount(codes, weights=dev * dev) / counts)[codes]
+        z = np.where(constant[codes], 0.0, dev / std)
+
+    return pd.Series(np.where(valid, z, np.nan), index=df.index)
 
 
 def standardize_score(col):
@@ -28,33 +120,35 @@ def standardize_score(col):
     return [0 if not np.isnan(c) else np.nan for c in col]
 
 
-def main():
-    ### append all files
-    dfs = []
-    for dir_name in os.listdir(RAW_DATA_PATH):
-        if os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, "protocols.pkl")):
-            df = pd.read_pickle(os.path.join(RAW_DATA_PATH, dir_name, "protocols.pkl"))
-            if not df.empty:
-                df["comp"] = dir_name
-                dfs.append(df)
+def load_protocols(dir_name):
+    """Read the raw protocols of one competition, or None if there are none."""
+    path = os.path.join(RAW_DATA_PATH, dir_name, "protocols")
+    if not table_exists(path):
+        return None
+    df = read_table(path)
+    if df.empty:
+        return None
+    df["comp"] = dir_name
+    return df
 
-    df = pd.concat(dfs, ignore_index=True)
 
+def clean_protocols(df, memory=None):
+    """
+    Clean the raw protocols, melt the judge columns and standardize the judge scores. The result has the dtypes of
+    CLEANED_SCHEMA; with a memory Counter, the in-memory size of the result with object columns (as before the schema)
+    and with the schema is added to memory["object"] and memory["schema"].
+    """
     ### Clean up the data; add new columns
     df["category"] = df["category"].str.lower()
-    df["discipline"] = df["category"].apply(extract_discipline)
-    df["program"] = df.apply(
-        lambda row: extract_program(row["category"], row["source"]), axis=1
-    )
+    df["discipline"] = extract_discipline_series(df["category"])
+    df["program"] = extract_program_series(df["category"], df["source"])
 
-    df["comp_type"], df["year"], df["season"] = zip(
-        *df["comp"].apply(extract_comp_type_season)
-    )
-    df["junior"] = df.apply(
-        lambda row: generate_junior_indicator(row["category"], row["comp_type"]), axis=1
+    df["comp_type"], df["year"], df["season"] = extract_comp_type_season_series(
+        df["comp"]
     )
-    df["deductions"] = df["deductions"].apply(np.abs)
-    df["team"] = df["source"].apply(lambda x: "team" in x.lower())
+    df["junior"] = generate_junior_indicator_series(df["category"], df["comp_type"])
+    df["deductions"] = df["deductions"].abs()
+    df["team"] = df["source"].str.lower().str.contains("team", regex=False)
 
     ### pivot the data and standardize judge scores
     judge_cols = [col for col in df.columns if re.search(r"^j\d+$", col)]
@@ -63,7 +157,14 @@ def main():
             df[col].astype(str).str.replace(",", "."), errors="coerce"
         )
 
+    # replace the skater's nation as RUS (Russian) is the nation is OAR and ROC
+    df["nation"] = df["nation"].replace({"OAR": "RUS", "ROC": "RUS"})
+
+    # the melt repeats every other column once per judge, so the repeated strings are made categoricals first
     id_vars = [col for col in df.columns if col not in judge_cols]
+    for col in id_vars:
+        if CLEANED_SCHEMA.get(col) == "category":
+            df[col] = df[col].astype("category")
     df = pd.melt(
         df,
         id_vars=id_vars,
@@ -75,18 +176,182 @@ def main():
     # standardize scores
     df = df[df["judge_score"].notna()]
     df = df[~((df["judge_score"] == 0) & (df["component"] == "PCS"))]
-    df["judge_score_std"] = df.groupby(
-        ["comp", "source", "rank", "element", "element_order"], dropna=False
-    )["judge_score"].transform(standardize_score)
+    df["judge_score_std"] = standardize_by_group(
+        df, ["comp", "source", "rank", "element", "element_order"], "judge_score"
+    )
     df.sort_values(
         by=["comp", "source", "rank", "element_order", "element", "judge_id"],
         inplace=True,
     )
 
-    # replace the skater's nation as RUS (Russian) is the nation is OAR and ROC
-    df["nation"] = df["nation"].apply(lambda x: "RUS" if x in ("OAR", "ROC") else x)
+    if memory is not None:
+        categoricals = [col for col in id_vars if CLEANED_SCHEMA.get(col) == "category"]
+        memory["object"] += (
+            df.reindex(columns=CLEANED_COLUMNS)
+            .astype({col: object for col in categoricals})
+            .memory_usage(deep=True, index=False)
+            .sum()
+        )
+
+    # the same columns and dtypes for every competition, so that partitions written separately share one schema
+    df = apply_schema(df, CLEANED_SCHEMA)
+    if memory is not None:
+        memory["schema"] += df.memory_usage(deep=True, index=False).sum()
+    return df
+
+
+def load_manifest():
+    """Hashes of the raw protocols each competition in the cleaned dataset was built from."""
+    manifest_path = os.path.join(CLEANED_DATA_PATH, "protocols", MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return dict()
+    with open(manifest_path, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def save_manifest(manifest):
+    dir_path = os.path.join(CLEANED_DATA_PATH, "protocols")
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, MANIFEST_FILE_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+
+def raw_protocols_hash(dir_name):
+    """
+    Hash of the raw protocols of a competition, tagged with the cleaned schema, so that the incremental mode also
+    cleans a competition again when CLEANED_SCHEMA changes (files of different schemas cannot be read as one dataset).
+    """
+    file_path = table_file(os.path.join(RAW_DATA_PATH, dir_name, "protocols"))
+    if file_path is None:
+        return None
+    return f"{sha256_of_file(file_path)}-{SCHEMA_VERSION}"
+
+
+def log_memory_report(memory):
+    """Log the in-memory size of the protocols cleaned in this run (see clean_protocols) and the size on disk."""
+    if memory["schema"] > 0:
+        logging.info(
+            f"Cleaned protocols in memory: {memory['object'] / 1e6:,.1f} MB with object columns, "
+            f"{memory['schema'] / 1e6:,.1f} MB with CLEANED_SCHEMA ({memory['object'] / memory['schema']:.1f}x smaller)"
+        )
+    root = os.path.join(CLEANED_DATA_PATH, "protocols")
+    size = sum(
+        os.path.getsize(os.path.join(dir_path, file_name))
+        for dir_path, _, file_names in os.walk(root)
+        for file_name in file_names
+    )
+    if os.path.isfile(root + ".pkl"):
+        size += os.path.getsize(root + ".pkl")
+    logging.info(f"Cleaned protocols on disk: {size / 1e6:,.1f} MB")
+
+
+def clean_all_at_once():
+    ### append all files
+    dfs = []
+    for dir_name in os.listdir(RAW_DATA_PATH):
+        df = load_protocols(dir_name)
+        if df is not None:
+            dfs.append(df)
+
+    df = pd.concat(dfs, ignore_index=True)
+    memory = Counter()
+    df = clean_protocols(df, memory)
+
+    write_cleaned(df, "protocols", CLEANED_DATA_PATH, OUTPUT_FORMAT)
+    log_memory_report(memory)
+    if OUTPUT_FORMAT == "parquet":
+        save_manifest(
+            {dir_name: raw_protocols_hash(dir_name) for dir_name in df["comp"].unique()}
+        )
+
+
+def clean_streaming(incremental=False, comps=None):
+    """
+    Clean one competition at a time and write it to its own files of the partitioned dataset, so that peak memory is
+    bounded by a single competition. With incremental=True, only competitions whose raw protocols changed since the
+    last run are cleaned again, and competitions whose raw protocols are gone are removed. With comps, only the given
+    competitions are looked at (e.g. the new ones of an update) and the rest of the dataset is left as it is.
+    """
+    root = os.path.join(CLEANED_DATA_PATH, "protocols")
+    if incremental or comps is not None:
+        manifest = load_manifest()
+    else:
+        manifest = dict()
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+
+    dir_names = sorted(
+        dir_name
+        for dir_name in (os.listdir(RAW_DATA_PATH) if comps is None else comps)
+        if table_exists(os.path.join(RAW_DATA_PATH, dir_name, "protocols"))
+    )
+
+    gone = set(manifest) - set(dir_names)
+    if comps is not None:
+        gone &= set(comps)
+    for dir_name in gone:
+        remove_competition(root, dir_name)
+        del manifest[dir_name]
+
+    skipped = 0
+    memory = Counter()
+    for dir_name in tqdm(dir_names):
+        raw_hash = raw_protocols_hash(dir_name)
+        if incremental and manifest.get(dir_name) == raw_hash:
+            skipped += 1
+            continue
+
+        with measure("07", dir_name):
+            df = load_protocols(dir_name)
+            if df is None:
+                remove_competition(root, dir_name)
+            else:
+                replace_competition(clean_protocols(df, memory), root, dir_name)
+        manifest[dir_name] = raw_hash
+        save_manifest(manifest)
+
+    save_manifest(manifest)
+    logging.info(
+        f"Cleaned {len(dir_names) - skipped} competitions, skipped {skipped} unchanged competitions."
+    )
+    log_memory_report(memory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="clean one competition at a time to bound memory (requires the parquet output format)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="with --streaming, only re-clean competitions whose raw protocols changed",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "07_protocol_pdf_cleaning.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    if args.incremental and not args.streaming:
+        parser.error("--incremental requires --streaming")
+    if args.streaming and OUTPUT_FORMAT != "parquet":
+        parser.error("--streaming requires OUTPUT_FORMAT = 'parquet'")
+
+    report = RunReport(LOG_PATH, "07_protocol_pdf_cleaning").install()
+
+    with measure("07"):
+        if args.streaming:
+            clean_streaming(incremental=args.incremental)
+        else:
+            clean_all_at_once()
 
-    df.to_pickle(os.path.join(CLEANED_DATA_PATH, "protocols.pkl"))
+    report.write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+"""
+This script links the judge numbers of the protocols (j1, j2, ...) to the named judges. For every judge number of every
+competition segment in the cleaned protocols, it looks up the judge's name, nation and gender in the cleaned judges and
+gives the judge a canonical key (judge_key) that is the same across the spelling variants of the name. The results are
+saved as data/cleaned/judge_panels (one row per segment and judge number) and data/cleaned/judge_identities (one row
+per judge_key, with the spelling variants).
+"""
+
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from file_paths import CLEANED_DATA_PATH, LOG_PATH, OUTPUT_FORMAT
+from utils.cleaning import judge_key, map_unique
+from utils.profiling import RunReport, measure
+from utils.storage import iter_cleaned, read_cleaned, write_table
+
+# a competition segment and judge number, as in the cleaned protocols
+PANEL_COLUMNS = [
+    "season",
+    "comp_type",
+    "comp",
+    "discipline",
+    "program",
+    "junior",
+    "team",
+    "judge_id",
+]
+
+# the team flag of the protocols comes from the file name and that of the judges from the category, so the two
+# tables are joined without it and the flag only decides between candidates
+JOIN_COLUMNS = ["comp", "discipline", "program", "junior", "judge_id"]
+
+JUDGE_COLUMNS = JOIN_COLUMNS + ["team", "Name", "Nation", "Nation2", "gender", "source"]
+
+# before the 2016-2017 season the judge numbers were randomized in the protocols, so a judge number only tells which
+# judges were on the panel, not who gave which score
+FIRST_NAMED_SEASON = 2016
+
+
+def load_protocol_panels():
+    """The distinct segments and judge numbers of the cleaned protocols, read in batches of the key columns only."""
+    panels = [
+        df.drop_duplicates()
+        for df in iter_cleaned("protocols", CLEANED_DATA_PATH, columns=PANEL_COLUMNS)
+    ]
+    return pd.concat(panels, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def load_judges():
+    df = read_cleaned("judges", CLEANED_DATA_PATH, columns=JUDGE_COLUMNS)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    df["judge_key"] = map_unique(df["Name"], judge_key)
+    return df.rename(columns={"team": "judge_team"})
+
+
+def resolve_panels(df_panels, df_judges):
+    """
+    Join the protocol segments and judge numbers to the judges (a hash join on JOIN_COLUMNS) and resolve each one to a
+    single judge. Where a segment matches the judges of two segments that differ only in the team flag (e.g. the
+    team event and the individual event of the Olympics), the judges with the same team flag are kept. The resolution
+    column tells whether a judge number was matched to one judge, to several (ambiguous; the judge columns are left
+    empty) or to none (unmatched).
+    """
+    df = df_panels.merge(df_judges, on=JOIN_COLUMNS, how="left")
+
+    df["same_team"] = df["team"] == df["judge_team"]
+    has_same_team = df.groupby(PANEL_COLUMNS, dropna=False)["same_team"].transform(
+        "any"
+    )
+    df = df[df["same_team"] | ~has_same_team]
+
+    judges = df.groupby(PANEL_COLUMNS, dropna=False)["judge_key"].transform("nunique")
+    df = df.assign(
+        resolution=np.select(
+            [judges == 1, judges > 1], ["matched", "ambiguous"], default="unmatched"
+        )
+    )
+    df = df.drop_duplicates(PANEL_COLUMNS, ignore_index=True)
+
+    judge_cols = ["Name", "Nation", "Nation2", "gender", "source", "judge_key"]
+    df.loc[df["resolution"] == "ambiguous", judge_cols] = None
+    df["anonymous"] = df["season"] < FIRST_NAMED_SEASON
+
+    return df[PANEL_COLUMNS + judge_cols + ["anonymous", "resolution"]].rename(
+        columns={"source": "judges_source"}
+    )
+
+
+def most_common(series):
+    values = series.dropna()
+    return values.mode().iloc[0] if len(values) > 0 else None
+
+
+def build_identities(df_panels):
+    """One row per judge_key: the most common spelling, nation and gender, all spellings, and the seasons judged."""
+    df = df_panels[df_panels["resolution"] == "matched"].copy()
+    df["nation"] = df["Nation2"].fillna(df["Nation"])
+    return (
+        df.groupby("judge_key")
+        .agg(
+            name=("Name", most_common),
+            nation=("nation", most_common),
+            gender=("gender", most_common),
+            variants=("Name", lambda names: " | ".join(sorted(names.unique()))),
+            panels=("comp", "size"),
+            first_season=("season", "min"),
+            last_season=("season", "max"),
+        )
+        .reset_index()
+    )
+
+
+def build_judge_panels():
+    df_panels = resolve_panels(load_protocol_panels(), load_judges())
+    df_identities = build_identities(df_panels)
+
+    for resolution, count in df_panels["resolution"].value_counts().items():
+        logging.info(f"{resolution}: {count:,} judge numbers")
+    logging.info(
+        f"{len(df_identities):,} judges, {(df_identities['variants'].str.contains(' | ', regex=False)).sum():,} "
+        "of them with more than one spelling of their name"
+    )
+
+    write_table(
+        df_panels, os.path.join(CLEANED_DATA_PATH, "judge_panels"), OUTPUT_FORMAT
+    )
+    write_table(
+        df_identities,
+        os.path.join(CLEANED_DATA_PATH, "judge_identities"),
+        OUTPUT_FORMAT,
+    )
+
+
+def main():
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "08_judge_panels.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    report = RunReport(LOG_PATH, "08_judge_panels").install()
+
+    start = time.time()
+
+    with measure("08"):
+        build_judge_panels()
+
+    report.write()
+
+    end = time.time()
+    logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
+
+
+if __name__ == "__main__":
+    main()
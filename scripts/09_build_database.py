@@ -0,0 +1,45 @@
+"""
+This script loads the cleaned judges and protocols (steps 05 and 07) and the judge panels (step 08) into a SQLite
+database (data/cleaned/skating.sqlite) with indexes on the competition segment and judge number, the name and nation,
+the season and the judge key, so that lookups such as all the scores given by one judge across seasons (see
+utils/database.py) do not need to load the cleaned tables.
+"""
+
+import logging
+import os
+import time
+
+from file_paths import CLEANED_DATA_PATH, DATABASE_PATH, LOG_PATH
+from utils.database import build_database
+from utils.profiling import RunReport, measure
+
+
+def main():
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "09_build_database.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    report = RunReport(LOG_PATH, "09_build_database").install()
+
+    start = time.time()
+
+    with measure("09"):
+        counts = build_database(CLEANED_DATA_PATH, DATABASE_PATH)
+
+    for table, count in counts.items():
+        logging.info(f"{table}: {count:,} rows")
+    logging.info(
+        f"Database written to {DATABASE_PATH} ({os.path.getsize(DATABASE_PATH) / 1e6:.1f} MB)"
+    )
+
+    report.write()
+
+    end = time.time()
+    logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+This script computes block-judging statistics from the cleaned protocols and the judge panels of step 08 (see
+utils/block_judging.py): the nationalistic bias of every judge (judge_bias), the deviation of every judge of every
+competition segment from the trimmed mean of the panel (panel_deviations) and the co-deviation of every pair of judges
+who sat on the same panels (judge_pairs). The results are saved in data/cleaned.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from file_paths import CLEANED_DATA_PATH, LOG_PATH, OUTPUT_FORMAT
+from utils.block_judging import PROTOCOL_COLUMNS, BlockJudging
+from utils.profiling import RunReport, measure
+from utils.storage import read_cleaned, read_table, write_table
+
+TABLES = ("judge_bias", "panel_deviations", "judge_pairs")
+
+
+def load_protocols():
+    """The columns of the cleaned protocols used by the statistics; the repeated strings stay categoricals."""
+    df = read_cleaned("protocols", CLEANED_DATA_PATH, columns=PROTOCOL_COLUMNS)
+    for col in ("judge_id", "component", "nation"):
+        df[col] = df[col].astype("category")
+    return df
+
+
+def build_block_judging(include_anonymous=False):
+    with measure("10", file="load") as row:
+        df_protocols = load_protocols()
+        df_panels = read_table(os.path.join(CLEANED_DATA_PATH, "judge_panels"))
+        row["rows"] = len(df_protocols)
+
+    with measure("10", file="codes"):
+        stats = BlockJudging(df_protocols, df_panels, include_anonymous)
+    del df_protocols
+
+    for name in TABLES:
+        with measure("10", file=name) as row:
+            df = getattr(stats, name)()
+            row["rows"] = len(df)
+        logging.info(f"{name}: {len(df):,} rows")
+        write_table(df, os.path.join(CLEANED_DATA_PATH, name), OUTPUT_FORMAT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--include-anonymous",
+        action="store_true",
+        help="also attribute the marks of the seasons with anonymous judging (before 2016-2017) to judges",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "10_block_judging.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    report = RunReport(LOG_PATH, "10_block_judging").install()
+
+    start = time.time()
+
+    with measure("10"):
+        build_block_judging(args.include_anonymous)
+
+    report.write()
+
+    end = time.time()
+    logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+This script benchmarks the block-judging statistics of step 10 (utils/block_judging.py) on a synthetic protocol table
+sized like the full crawl (379 competitions by default), with named judges and skater nations and a bias planted for
+the judges' own nation, and checks them against a plain pandas groupby/merge implementation on the first competitions.
+
+Example:
+    python benchmarks/bench_block_judging.py --comps 379
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.block_judging import ITEM_COLUMNS, SEGMENT_COLUMNS, BlockJudging
+
+cleaning = importlib.import_module("07_protocol_pdf_cleaning")
+
+DISCIPLINES = ["men", "women", "pairs", "ice dance"]
+PROGRAMS = ["sp", "fs"]
+
+
+def synthetic_protocols(
+    comps,
+    skaters=24,
+    tes_elements=12,
+    pcs_components=5,
+    judges=9,
+    pool=1500,
+    nations=40,
+    bias=0.5,
+    seed=0,
+):
+    """
+    Melted protocols of comps competitions (one segment per discipline and program) and their judge panels: every
+    panel is drawn from a pool of judges, and every judge marks the skaters of their own nation bias marks higher.
+    """
+    rng = np.random.default_rng(seed)
+    n_segments = comps * len(DISCIPLINES) * len(PROGRAMS)
+    elements_per_skater = tes_elements + pcs_components
+    rows_per_skater = elements_per_skater * judges
+
+    # the judge of every seat and the nation of every judge and skater
+    seat_judge = np.argsort(rng.random((n_segments, pool)), axis=1)[:, :judges]
+    judge_nation = rng.integers(0, nations, size=pool)
+    skater_nation = rng.integers(0, nations, size=(n_segments, skaters))
+
+    skater = np.repeat(np.arange(n_segments * skaters), rows_per_skater)
+    within = np.tile(np.arange(rows_per_skater), n_segments * skaters)
+    segment = skater // skaters
+    element_index = within // judges
+    seat = within % judges
+    is_tes = element_index < tes_elements
+    comp, segment_of_comp = np.divmod(segment, len(DISCIPLINES) * len(PROGRAMS))
+    discipline, program = np.divmod(segment_of_comp, len(PROGRAMS))
+
+    nation_names = [f"N{i:02d}" for i in range(nations)]
+    df = pd.DataFrame(
+        {
+            "comp": pd.Categorical.from_codes(comp, [f"comp{i}" for i in range(comps)]),
+            "discipline": pd.Categorical.from_codes(discipline, DISCIPLINES),
+            "program": pd.Categorical.from_codes(program, PROGRAMS),
+            "junior": False,
+            "team": False,
+            "source": pd.Categorical.from_codes(
+                segment_of_comp,
+                [
+                    f"seg_{i}_Scores.pdf"
+                    for i in range(len(DISCIPLINES) * len(PROGRAMS))
+                ],
+            ),
+            "rank": skater % skaters + 1,
+            "element": pd.Categorical.from_codes(
+                element_index,
+                [
+                    f"E{i}" if i < tes_elements else f"C{i}"
+                    for i in range(elements_per_skater)
+                ],
+            ),
+            "element_order": np.where(is_tes, element_index + 1.0, np.nan),
+            "component": pd.Categorical.from_codes(is_tes.astype(int), ["PCS", "TES"]),
+            "nation": pd.Categorical.from_codes(
+                skater_nation.ravel()[skater], nation_names
+            ),
+            "judge_id": pd.Categorical.from_codes(
+                seat, [f"j{i}" for i in range(1, judges + 1)]
+            ),
+        }
+    )
+    goe = rng.integers(-3, 4, size=len(df)).astype(float)
+    pcs = rng.integers(20, 40, size=len(df)) / 4
+    same = judge_nation[seat_judge[segment, seat]] == skater_nation.ravel()[skater]
+    df["judge_score"] = np.where(is_tes, goe, pcs) + np.where(same, bias, 0.0)
+    df["judge_score_std"] = cleaning.standardize_by_group(
+        df, ITEM_COLUMNS, "judge_score"
+    )
+
+    panel_segment, panel_seat = np.divmod(np.arange(n_segments * judges), judges)
+    panel_comp, panel_segment_of_comp = np.divmod(
+        panel_segment, len(DISCIPLINES) * len(PROGRAMS)
+    )
+    panel_discipline, panel_program = np.divmod(panel_segment_of_comp, len(PROGRAMS))
+    judge = seat_judge.ravel()
+    df_panels = pd.DataFrame(
+        {
+            "comp": [f"comp{i}" for i in panel_comp],
+            "discipline": np.array(DISCIPLINES)[panel_discipline],
+            "program": np.array(PROGRAMS)[panel_program],
+            "junior": False,
+            "team": False,
+            "judge_id": [f"j{i + 1}" for i in panel_seat],
+            "judge_key": [f"judge {i:04d}" for i in judge],
+            "Nation2": np.array(nation_names)[judge_nation[judge]],
+            "anonymous": False,
+        }
+    )
+    return df, df_panels
+
+
+def reference_statistics(df, df_panels):
+    """The three tables of BlockJudging with pandas groupby and merges."""
+    df = df[df["judge_score"].notna()].astype({"component": object, "nation": object})
+    df = df.astype({col: object for col in SEGMENT_COLUMNS + ["judge_id"]}).merge(
+        df_panels, on=SEGMENT_COLUMNS + ["judge_id"], how="left"
+    )
+
+    known = df[df["judge_key"].notna() & df["Nation2"].notna() & df["nation"].notna()]
+    bias = (
+        known.assign(same=known["Nation2"] == known["nation"])
+        .groupby(["judge_key", "same"])["judge_score_std"]
+        .mean()
+        .unstack()
+    )
+    bias = (bias[True] - bias[False]).rename("bias").dropna()
+
+    def trimmed_mean(scores):
+        if len(scores) < 3:
+            return scores.mean()
+        return (scores.sum() - scores.max() - scores.min()) / (len(scores) - 2)
+
+    df["deviation"] = df["judge_score"] - df.groupby(
+        ITEM_COLUMNS, dropna=False, observed=True
+    )["judge_score"].transform(trimmed_mean)
+    deviations = (
+        df.groupby(SEGMENT_COLUMNS + ["judge_id", "component"])["deviation"]
+        .mean()
+        .rename("mean_deviation")
+    )
+
+    marks = df[df["judge_key"].notna()][
+        ITEM_COLUMNS + ["judge_key", "judge_score_std"]
+    ].dropna(subset=["judge_score_std"])
+    pairs = marks.merge(marks, on=ITEM_COLUMNS, suffixes=("_1", "_2"))
+    pairs = pairs[pairs["judge_key_1"] < pairs["judge_key_2"]]
+    pairs = (
+        (pairs["judge_score_std_1"] * pairs["judge_score_std_2"])
+        .groupby([pairs["judge_key_1"], pairs["judge_key_2"]])
+        .mean()
+        .rename("co_deviation")
+    )
+    return bias, deviations, pairs
+
+
+def max_difference(fast, slow, keys):
+    merged = fast.set_index(keys)[slow.name].align(slow, join="outer")
+    return (merged[0] - merged[1]).abs().max()
+
+
+def time_it(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--comps", type=int, default=379)
+    parser.add_argument(
+        "--check-comps",
+        type=int,
+        default=5,
+        help="number of competitions compared with the pandas implementation (0 to skip)",
+    )
+    args = parser.parse_args()
+
+    df, df_panels = synthetic_protocols(args.comps)
+    print(f"{len(df):,} rows, {df_panels['judge_key'].nunique():,} judges")
+
+    codes_time, stats = time_it(lambda: BlockJudging(df, df_panels))
+    print(f"group codes:          {codes_time:8.2f}s")
+    tables = dict()
+    for name in ("judge_bias", "panel_deviations", "judge_pairs"):
+        table_time, tables[name] = time_it(getattr(stats, name))
+        print(f"{name + ':':<21} {table_time:8.2f}s ({len(tables[name]):,} rows)")
+    print(f"mean bias:            {tables['judge_bias']['bias'].mean():8.3f}")
+
+    if not args.check_comps:
+        return
+
+    comps = [f"comp{i}" for i in range(min(args.check_comps, args.comps))]
+    small = df[df["comp"].isin(comps)].copy()
+    small_panels = df_panels[df_panels["comp"].isin(comps)]
+    stats = BlockJudging(small, small_panels)
+    slow_time, (bias, deviations, pairs) = time_it(
+        lambda: reference_statistics(small, small_panels)
+    )
+    fast_time, (fast_bias, fast_deviations, fast_pairs) = time_it(
+        lambda: (stats.judge_bias(), stats.panel_deviations(), stats.judge_pairs())
+    )
+    print(f"{len(comps)} competitions: pandas {slow_time:.2f}s, NumPy {fast_time:.2f}s")
+
+    fast_deviations = fast_deviations.astype(
+        {col: object for col in SEGMENT_COLUMNS + ["judge_id", "component"]}
+    )
+    differences = [
+        max_difference(fast_bias, bias, ["judge_key"]),
+        max_difference(
+            fast_deviations, deviations, SEGMENT_COLUMNS + ["judge_id", "component"]
+        ),
+        max_difference(fast_pairs, pairs, ["judge_key_1", "judge_key_2"]),
+    ]
+    print(f"max abs difference:   {max(differences):.2e}")
+    if not max(differences) < 1e-9:
+        sys.exit("The two implementations disagree.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+This script checks the vectorized cleaning helpers of steps 05 and 07 (extract_discipline_series,
+extract_program_series, generate_junior_indicator_series, extract_comp_type_season_series and get_gender_series)
+against their scalar versions, element by element, on the categories, sources, competitions and judge names of the
+wc2014 sample plus edge cases and missing values, and reports the time taken by each on the sample repeated --repeat
+times (the scalar functions through the row-wise apply calls that steps 05 and 07 used before). The scalar functions
+raise on a missing value, which the vectorized ones treat as an empty string.
+
+Example:
+    python benchmarks/bench_cleaning_series.py
+    python benchmarks/bench_cleaning_series.py --repeat 1000
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_paths import RAW_DATA_PATH
+from utils.cleaning import (
+    extract_comp_type_season,
+    extract_comp_type_season_series,
+    extract_discipline,
+    extract_discipline_series,
+    extract_program,
+    extract_program_series,
+    generate_junior_indicator,
+    generate_junior_indicator_series,
+)
+from utils.storage import read_table
+
+judge_cleaning = importlib.import_module("05_judge_cleaning")
+
+EDGE_CATEGORIES = [
+    "men short program",
+    "women free skating",
+    "ladies short program",
+    "pairs free skating",
+    "ice dance rhythm dance",
+    "ice dance original dance",
+    "ice dance compulsory dance",
+    "junior men free skating",
+    "team event women short program",
+    "",
+    None,
+    np.nan,
+]
+EDGE_SOURCES = [
+    "wc2014_Men_SP_Scores.pdf",
+    "data0103-qual.pdf",
+    "data0105-fnl.pdf",
+    "SEG001OF.HTM",
+    "wc2014_Dance_OD_Scores.pdf",
+    "",
+]
+EDGE_COMPS = ["wc2014", "jgp5pol2022", "gpcan2014", "jgpf1213", "wjc2014", "wyog2020"]
+EDGE_NAMES = ["Mr. John SMITH", "Ms Anna LEE", "Mrs. Jane DOE", "Mr", "Dr. X", "", None]
+
+
+def sample_values():
+    """Categories, sources, competitions and judge names of the wc2014 sample followed by the edge cases."""
+    dir_path = os.path.join(RAW_DATA_PATH, "wc2014")
+    df_protocols = read_table(os.path.join(dir_path, "protocols"))
+    df_judges = read_table(os.path.join(dir_path, "judges"))
+    categories = pd.concat(
+        [df_protocols["category"], df_judges["category"]], ignore_index=True
+    ).str.lower()
+    sources = pd.concat(
+        [df_protocols["source"], df_judges["source"]], ignore_index=True
+    )
+
+    # every edge category with every edge source, and the sample pairs
+    edge = pd.MultiIndex.from_product([EDGE_CATEGORIES, EDGE_SOURCES]).to_frame(
+        index=False, name=["category", "source"]
+    )
+    df = pd.concat(
+        [pd.DataFrame({"category": categories, "source": sources}), edge],
+        ignore_index=True,
+    ).astype(object)
+    df["comp"] = np.resize(["wc2014"] + EDGE_COMPS, len(df))
+    names = pd.Series(
+        list(df_judges["Name"]) + EDGE_NAMES + [np.nan], dtype=object
+    ).reset_index(drop=True)
+    return df, names
+
+
+def scalar(func, *args):
+    """The scalar function applied to one row, with the missing values replaced by empty strings."""
+    return func(*(arg if isinstance(arg, str) else "" for arg in args))
+
+
+def scalar_results(df, names):
+    comp_type_season = [extract_comp_type_season(comp) for comp in df["comp"]]
+    return {
+        "discipline": [scalar(extract_discipline, c) for c in df["category"]],
+        "program": [
+            scalar(extract_program, c, s) for c, s in zip(df["category"], df["source"])
+        ],
+        "junior": [
+            scalar(generate_junior_indicator, c, comp_type)
+            for c, (comp_type, _, _) in zip(df["category"], comp_type_season)
+        ],
+        "comp_type": [value[0] for value in comp_type_season],
+        "year": [value[1] for value in comp_type_season],
+        "season": [value[2] for value in comp_type_season],
+        "gender": [scalar(judge_cleaning.get_gender, name) for name in names],
+    }
+
+
+def apply_results(df, names):
+    """The scalar functions through the row-wise apply calls, as steps 05 and 07 used them before."""
+    comp_type, year, season = zip(*df["comp"].apply(extract_comp_type_season))
+    df = df.assign(comp_type=comp_type)
+    return {
+        "discipline": df["category"].apply(lambda c: scalar(extract_discipline, c)),
+        "program": df.apply(
+            lambda row: scalar(extract_program, row["category"], row["source"]), axis=1
+        ),
+        "junior": df.apply(
+            lambda row: scalar(
+                generate_junior_indicator, row["category"], row["comp_type"]
+            ),
+            axis=1,
+        ),
+        "comp_type": comp_type,
+        "year": year,
+        "season": season,
+        "gender": names.apply(lambda name: scalar(judge_cleaning.get_gender, name)),
+    }
+
+
+def series_results(df, names):
+    comp_type, year, season = extract_comp_type_season_series(df["comp"])
+    return {
+        "discipline": extract_discipline_series(df["category"]),
+        "program": extract_program_series(df["category"], df["source"]),
+        "junior": generate_junior_indicator_series(df["category"], comp_type),
+        "comp_type": comp_type,
+        "year": year,
+        "season": season,
+        "gender": judge_cleaning.get_gender_series(names),
+    }
+
+
+def time_it(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=100,
+        help="number of copies of the sample in the timed run",
+    )
+    args = parser.parse_args()
+
+    df, names = sample_values()
+    print(f"{len(df):,} categories and sources, {len(names):,} names")
+
+    expected = scalar_results(df, names)
+    actual = series_results(df, names)
+    mismatches = 0
+    for col, values in expected.items():
+        for i, (want, got) in enumerate(zip(values, actual[col])):
+            if not (want == got or (pd.isna(want) and pd.isna(got))):
+                mismatches += 1
+                print(f"{col}, row {i}: scalar {want!r}, vectorized {got!r}")
+    print(f"mismatches:           {mismatches}")
+
+    big = pd.concat([df] * args.repeat, ignore_index=True)
+    big_names = pd.concat([names] * args.repeat, ignore_index=True)
+    slow_time, _ = time_it(lambda: apply_results(big, big_names))
+    fast_time, _ = time_it(lambda: series_results(big, big_names))
+    print(f"row-wise apply:       {slow_time:8.2f}s")
+    print(f"vectorized functions: {fast_time:8.2f}s")
+    print(f"speedup:              {slow_time / fast_time:8.1f}x")
+
+    if mismatches:
+        sys.exit("The two implementations disagree.")
+
+
+if __name__ == "__main__":
+    main()
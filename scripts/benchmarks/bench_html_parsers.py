@@ -0,0 +1,152 @@
+"""
+This script compares the lxml fast path of the HTML parsing in steps 02 and 04 with the original BeautifulSoup
+(html.parser) implementation: for every downloaded competition page (step 02) and judges' page (step 04) it checks that
+both give the same result and reports the time taken by each.
+
+Example:
+    python benchmarks/bench_html_parsers.py
+    python benchmarks/bench_html_parsers.py --comps wc2014,ec2014 --repeat 3
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_paths import RAW_DATA_PATH
+
+link_name_mapping = importlib.import_module("02_link_name_mapping")
+judge_scraping = importlib.import_module("04_judge_scraping")
+
+
+def judge_pages(dir_name):
+    """The file names of the judges' pages of a competition, as selected by step 04."""
+    with open(
+        os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json"),
+        "r",
+        encoding="utf-8",
+    ) as json_file:
+        data = json.load(json_file)
+    return [
+        key
+        for key, value in data.items()
+        if ("panel of judges" in value.lower() or "officials" in value.lower())
+        and os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, key))
+    ]
+
+
+def link_table_bs4(file_path):
+    table = link_name_mapping.extract_table_from_html(file_path)
+    return link_name_mapping.extract_texts_and_links(table)
+
+
+def link_table_lxml(file_path):
+    table = link_name_mapping.extract_table_lxml(file_path)
+    return link_name_mapping.extract_texts_and_links_lxml(table)
+
+
+def time_it(func, repeat, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def same_result(bs4_result, lxml_result):
+    """Whether the results are equal; an error message counts as a result."""
+    if isinstance(bs4_result, tuple):
+        return all(same_result(a, b) for a, b in zip(bs4_result, lxml_result))
+    if isinstance(bs4_result, pd.DataFrame) and isinstance(lxml_result, pd.DataFrame):
+        return bs4_result.equals(lxml_result) and list(bs4_result.columns) == list(
+            lxml_result.columns
+        )
+    return bs4_result == lxml_result
+
+
+def run_both(func_bs4, func_lxml, repeat, *args):
+    """Time both implementations and return their timings and whether they agree."""
+    results = []
+    timings = []
+    for func in (func_bs4, func_lxml):
+        try:
+            timing, result = time_it(func, repeat, *args)
+        except Exception as e:
+            timing, result = None, repr(e)
+        timings.append(timing)
+        results.append(result)
+    return timings, same_result(*results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--comps",
+        default=None,
+        help="comma-separated competitions (default: all downloaded competitions)",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.comps:
+        dir_names = args.comps.split(",")
+    else:
+        dir_names = sorted(
+            dir_name
+            for dir_name in os.listdir(RAW_DATA_PATH)
+            if os.path.isfile(os.path.join(RAW_DATA_PATH, dir_name, f"{dir_name}.html"))
+        )
+
+    totals = {"02": [0.0, 0.0, 0], "04": [0.0, 0.0, 0]}
+    mismatches = []
+    for dir_name in dir_names:
+        file_path = os.path.join(RAW_DATA_PATH, dir_name, f"{dir_name}.html")
+        pages = [("02", link_table_bs4, link_table_lxml, (file_path,))]
+        if os.path.isfile(
+            os.path.join(RAW_DATA_PATH, dir_name, "link_name_mapping.json")
+        ):
+            pages += [
+                (
+                    "04",
+                    judge_scraping.extract_one_table,
+                    judge_scraping.extract_one_table_lxml,
+                    (dir_name, key),
+                )
+                for key in judge_pages(dir_name)
+            ]
+
+        for stage, func_bs4, func_lxml, func_args in pages:
+            (bs4_time, lxml_time), same = run_both(
+                func_bs4, func_lxml, args.repeat, *func_args
+            )
+            if not same:
+                mismatches.append(
+                    f"{stage} {dir_name} - {os.path.basename(func_args[-1])}"
+                )
+            if bs4_time is not None and lxml_time is not None:
+                totals[stage][0] += bs4_time
+                totals[stage][1] += lxml_time
+                totals[stage][2] += 1
+
+    for stage, (bs4_time, lxml_time, pages) in totals.items():
+        if pages == 0:
+            continue
+        print(
+            f"{stage}: {pages} pages, html.parser {bs4_time:.3f}s, lxml {lxml_time:.3f}s, "
+            f"speedup {bs4_time / lxml_time:.1f}x"
+        )
+
+    if mismatches:
+        sys.exit("Results differ:\n" + "\n".join(mismatches))
+    print("The lxml and html.parser results are identical.")
+
+
+if __name__ == "__main__":
+    main()
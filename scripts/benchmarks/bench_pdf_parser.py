@@ -0,0 +1,257 @@
+"""
+This script benchmarks the protocol PDF parser (utils/pdf_scraping.py) phase by phase: text extraction, line
+splitting, skater segmentation and DataFrame construction. It runs over the protocols of the sample competition
+(data/raw/wc2014/*_Scores.pdf) and over a synthetic large protocol built by repeating those PDFs.
+
+The timings and a hash of the parsed output are compared with the saved baseline (benchmarks/baselines/); the script
+exits with an error if a phase got slower than the tolerance allows or if the parsed output changed. After an intended
+change (or on a new machine), save a new baseline with --save-baseline.
+
+--engine words benchmarks the word box extraction engine instead of the text engine. Its timings have their own
+baseline, but its parsed output is checked against the output of the text engine.
+
+Example:
+    python benchmarks/bench_pdf_parser.py
+    python benchmarks/bench_pdf_parser.py --engine words
+    python benchmarks/bench_pdf_parser.py --save-baseline
+"""
+
+import argparse
+import copy
+import gc
+import glob
+import hashlib
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import fitz
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.pdf_scraping as ut
+from file_paths import RAW_DATA_PATH
+
+scraping = importlib.import_module("06_protocol_pdf_scraping")
+
+COMP = "wc2014"
+SEASON = 2013
+PHASES = ["extract", "split", "segment", "dataframe"]
+
+# slowdowns below this many seconds are timer noise, whatever the ratio
+MIN_SLOWDOWN = 0.05
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_pdf_parser.json"
+)
+
+
+def synthetic_protocol(file_paths, pages):
+    """
+    A large protocol built by appending the protocol PDFs one after another until it has at least the given number
+    of pages. Whole PDFs are appended so that no skater is cut in half.
+    """
+    doc = fitz.open()
+    while doc.page_count < pages:
+        for file_path in file_paths:
+            doc.insert_pdf(fitz.open(file_path))
+            if doc.page_count >= pages:
+                break
+    return doc
+
+
+def load_datasets(synthetic_pages):
+    """The datasets as lists of (file name, protocol pages)."""
+    file_paths = sorted(glob.glob(os.path.join(RAW_DATA_PATH, COMP, "*_Scores.pdf")))
+    if not file_paths:
+        sys.exit(f"No protocols found in {os.path.join(RAW_DATA_PATH, COMP)}.")
+
+    datasets = {
+        COMP: [
+            # the PyMuPDF pages themselves, so that every repeat extracts the text again
+            (
+                os.path.basename(file_path),
+                [page.page for page in scraping.open_protocol(file_path)],
+            )
+            for file_path in file_paths
+        ]
+    }
+    if synthetic_pages:
+        doc = synthetic_protocol(file_paths, synthetic_pages)
+        datasets["synthetic"] = [("synthetic_Scores.pdf", doc)]
+    return datasets
+
+
+def to_dataframes(dataset, skaters):
+    dfs = []
+    for (file_name, _), file_skaters in zip(dataset, skaters):
+        dfs.append(
+            ut.rows_to_dataframe(
+                [
+                    ut.Skater(skater, COMP, file_name, SEASON).to_rows()
+                    for skater in file_skaters
+                    if skater
+                ]
+            )
+        )
+    return dfs
+
+
+def output_hash(dfs):
+    sha = hashlib.sha256()
+    for df in dfs:
+        sha.update(df.to_csv(index=False).encode("utf-8"))
+    return sha.hexdigest()[:16]
+
+
+def time_it(func, repeat, setup=lambda: None):
+    """
+    Median of repeat runs of func(setup()); setup is not timed. As in timeit, garbage collection is off while timing.
+    The median is used rather than the best run so that a single lucky run does not end up in the baseline.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = func(arg)
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return statistics.median(timings), result
+
+
+def run_dataset(dataset, repeat, engine):
+    """Time each phase on the output of the previous one and return the timings and the output hash."""
+    if engine == "words":
+        extract = ut.extract_word_rows
+        split = ut.split_rows
+    else:
+        extract = ut.extract_text_lines
+        split = lambda texts: ut.split_lines(texts, COMP, SEASON)
+
+    timings = dict()
+    timings["extract"], texts = time_it(
+        lambda _: [extract(doc) for _, doc in dataset], repeat
+    )
+    timings["split"], lines = time_it(lambda _: [split(text) for text in texts], repeat)
+    timings["segment"], skaters = time_it(
+        lambda _: [ut.separate_skaters(file_lines) for file_lines in lines], repeat
+    )
+    # to_rows modifies the rows in place, so every run gets a fresh copy
+    timings["dataframe"], dfs = time_it(
+        lambda skaters_copy: to_dataframes(dataset, skaters_copy),
+        repeat,
+        setup=lambda: copy.deepcopy(skaters),
+    )
+    n_rows = sum(len(df) for df in dfs)
+    return timings, n_rows, output_hash(dfs)
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "pymupdf": fitz.VersionBind,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(results, baseline, engine, tolerance):
+    """
+    Print the comparison with the baseline and return the list of regressions. The timings are compared with the
+    baseline of the same engine and the parsed output with the baseline of the text engine.
+    """
+    regressions = []
+    if baseline["machine"] != machine_info():
+        print("Warning: the baseline was saved on a different machine or environment.")
+    for dataset, result in results.items():
+        reference = baseline["results"]["text"].get(dataset)
+        if reference and result["output_hash"] != reference["output_hash"]:
+            regressions.append(
+                f"{dataset}: parsed output differs from the text engine ({reference['rows']} rows, hash "
+                f"{reference['output_hash']} -> {result['rows']} rows, hash {result['output_hash']})"
+            )
+        if dataset not in baseline["results"].get(engine, dict()):
+            continue
+        expected = baseline["results"][engine][dataset]
+        for phase in PHASES:
+            ratio = result["timings"][phase] / expected["timings"][phase]
+            print(f"{dataset:>10} {phase:>10}: {ratio:6.2f}x baseline")
+            slowdown = result["timings"][phase] - expected["timings"][phase]
+            if ratio > 1 + tolerance and slowdown > MIN_SLOWDOWN:
+                regressions.append(
+                    f"{dataset} {phase}: {result['timings'][phase]:.3f}s vs {expected['timings'][phase]:.3f}s baseline"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--engine", choices=ut.ENGINES, default="text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--synthetic-pages",
+        type=int,
+        default=200,
+        help="size of the synthetic protocol in pages (0 to skip it)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown of a phase relative to the baseline (0.25 = 25%%)",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = dict()
+    for name, dataset in load_datasets(args.synthetic_pages).items():
+        pages = sum(len(doc) for _, doc in dataset)
+        timings, n_rows, digest = run_dataset(dataset, args.repeat, args.engine)
+        results[name] = {
+            "pages": pages,
+            "rows": n_rows,
+            "output_hash": digest,
+            "timings": timings,
+        }
+        print(f"{name}: {len(dataset)} PDFs, {pages} pages, {n_rows:,} rows")
+        for phase in PHASES:
+            print(f"{phase:>12}: {timings[phase]:8.3f}s")
+
+    baseline = None
+    if os.path.isfile(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as json_file:
+            baseline = json.load(json_file)
+
+    if args.save_baseline:
+        if baseline is None or baseline["machine"] != machine_info():
+            baseline = {"machine": machine_info(), "results": dict()}
+        baseline["results"][args.engine] = results
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as json_file:
+            json.dump(baseline, json_file, indent=4)
+        print(f"Baseline of the {args.engine} engine saved to {BASELINE_PATH}")
+        return
+
+    if baseline is None or "text" not in baseline["results"]:
+        sys.exit(
+            f"No baseline of the text engine at {BASELINE_PATH}; run with --save-baseline first."
+        )
+
+    regressions = compare(results, baseline, args.engine, args.tolerance)
+    if regressions:
+        sys.exit("Regressions:\n" + "\n".join(regressions))
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
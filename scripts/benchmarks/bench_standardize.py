@@ -0,0 +1,132 @@
+"""
+This script benchmarks the judge score standardization of step 07: the original groupby().transform(standardize_score)
+callback against the segment-sum implementation standardize_by_group, on a synthetic melted protocol table sized like
+the full crawl (379 competitions by default), and checks that both give the same result.
+
+Example:
+    python benchmarks/bench_standardize.py --comps 379
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+cleaning = importlib.import_module("07_protocol_pdf_cleaning")
+
+KEYS = ["comp", "source", "rank", "element", "element_order"]
+
+
+def synthetic_protocols(
+    comps, sources=8, skaters=24, tes_elements=12, pcs_components=5, judges=9, seed=0
+):
+    """
+    Melted protocol table with one row per (competition, segment, skater, element, judge). The string columns are
+    categoricals to keep the full-size table in memory.
+    """
+    rng = np.random.default_rng(seed)
+    elements_per_skater = tes_elements + pcs_components
+    rows_per_panel = elements_per_skater * judges
+    n_panels = comps * sources * skaters
+
+    panel = np.repeat(np.arange(n_panels), rows_per_panel)
+    within = np.tile(np.arange(rows_per_panel), n_panels)
+    element_index = within // judges
+    is_tes = element_index < tes_elements
+
+    comp = panel // (sources * skaters)
+    source = (panel // skaters) % sources
+
+    df = pd.DataFrame(
+        {
+            "comp": pd.Categorical.from_codes(comp, [f"comp{i}" for i in range(comps)]),
+            "source": pd.Categorical.from_codes(
+                source, [f"seg_{i}_Scores.pdf" for i in range(sources)]
+            ),
+            "rank": (panel % skaters + 1).astype(float),
+            "element": pd.Categorical.from_codes(
+                element_index,
+                [
+                    f"E{i}" if i < tes_elements else f"C{i}"
+                    for i in range(elements_per_skater)
+                ],
+            ),
+            "element_order": np.where(is_tes, element_index + 1.0, np.nan),
+            "judge_id": pd.Categorical.from_codes(
+                within % judges, [f"j{i}" for i in range(1, judges + 1)]
+            ),
+        }
+    )
+    goe = rng.integers(-5, 6, size=len(df)).astype(float)
+    pcs = rng.integers(500, 1000, size=len(df)) / 100
+    df["judge_score"] = np.where(is_tes, goe, pcs)
+
+    # some panels agree completely (zero std), as happens for many elements
+    agree = rng.random(n_panels * elements_per_skater) < 0.05
+    agree = np.repeat(agree, judges)
+    df.loc[agree & is_tes, "judge_score"] = 0.0
+
+    # and some agree on a mark that is not exact in binary, whose mean over the panel is not exact either
+    constant = rng.random(n_panels * elements_per_skater) < 0.05
+    marks = rng.choice([0.1, 0.7, 2.3, 0.35], size=len(constant))
+    constant = np.repeat(constant, judges)
+    df.loc[constant, "judge_score"] = np.repeat(marks, judges)[constant]
+
+    return df
+
+
+def time_it(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--comps", type=int, default=379)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--skip-transform",
+        action="store_true",
+        help="only time the fast implementation (the transform callback takes minutes on the full size)",
+    )
+    args = parser.parse_args()
+
+    df = synthetic_protocols(args.comps)
+    n_groups = df.groupby(KEYS, dropna=False, observed=True).ngroups
+    print(f"{len(df):,} rows, {n_groups:,} groups")
+
+    fast_time, fast = time_it(
+        lambda: cleaning.standardize_by_group(df, KEYS, "judge_score"), args.repeat
+    )
+    print(f"standardize_by_group:            {fast_time:8.2f}s")
+
+    if args.skip_transform:
+        return
+
+    slow_time, slow = time_it(
+        lambda: df.groupby(KEYS, dropna=False, observed=True)["judge_score"].transform(
+            cleaning.standardize_score
+        ),
+        args.repeat,
+    )
+    print(f"transform(standardize_score):    {slow_time:8.2f}s")
+    print(f"speedup:                         {slow_time / fast_time:8.1f}x")
+
+    max_diff = (fast - slow.astype(float)).abs().max()
+    print(f"max abs difference:              {max_diff:.2e}")
+    if not max_diff < 1e-9:
+        sys.exit("The two implementations disagree.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,15 @@ DATA_PATH = os.path.join(BASE_PATH, "data")
 LINKS_PATH = os.path.join(DATA_PATH, "links", "comp_links.csv")
 RAW_DATA_PATH = os.path.join(DATA_PATH, "raw")
 CLEANED_DATA_PATH = os.path.join(DATA_PATH, "cleaned")
+ARCHIVE_PATH = os.path.join(DATA_PATH, "archive")
+CACHE_PATH = os.path.join(DATA_PATH, "cache")
+DATABASE_PATH = os.path.join(CLEANED_DATA_PATH, "skating.sqlite")
 
 LOG_PATH = os.path.join(BASE_PATH, "logs")
+
+# format of the per-competition and cleaned outputs: "parquet" or "pickle"
+OUTPUT_FORMAT = "parquet"
+
+# where the downloaded pages and PDFs are kept: "files" (loose files under data/raw/{comp}/) or "archive" (one
+# compressed, content-addressed pack per season under data/archive/, see utils/raw_store.py)
+RAW_STORAGE = "files"
@@ -0,0 +1,102 @@
+"""
+This script moves the downloaded pages and PDFs of data/raw/{comp}/ (the main results page and the files listed in
+link_name_mapping.json) into the raw archive, one compressed pack per season under data/archive/. Set RAW_STORAGE to
+"archive" in file_paths.py to make the pipeline read and write the archive. The link name mappings, the download
+metadata and the scraped tables stay in data/raw/{comp}/.
+
+Example:
+    python pack_raw_archive.py --remove
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from file_paths import ARCHIVE_PATH, LOG_PATH, RAW_DATA_PATH
+from tqdm import tqdm
+from utils.raw_store import ArchiveStore
+
+
+def downloaded_files(dir_name):
+    """The loose downloaded files of a competition: its main results page and the files of its link name mapping."""
+    dir_path = os.path.join(RAW_DATA_PATH, dir_name)
+    keys = [f"{dir_name}.html"]
+    mapping_path = os.path.join(dir_path, "link_name_mapping.json")
+    if os.path.isfile(mapping_path):
+        with open(mapping_path, "r", encoding="utf-8") as json_file:
+            keys += [key.split("/")[-1] for key in json.load(json_file)]
+    paths = [os.path.join(dir_path, key) for key in dict.fromkeys(keys)]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def pack_competition(store, dir_name, remove=False):
+    """Add the loose files of a competition to the archive and return (files, bytes) packed."""
+    packed, size = 0, 0
+    for file_path in downloaded_files(dir_name):
+        with open(file_path, "rb") as file:
+            body = file.read()
+        store.write(file_path, body)
+        if remove:
+            # the archive copy is read back before the loose file is deleted
+            if store.read(file_path) != body:
+                raise RuntimeError(f"{file_path}: archive copy differs from the file")
+            os.remove(file_path)
+        packed += 1
+        size += len(body)
+    return packed, size
+
+
+def archive_size(archive_path):
+    if not os.path.isdir(archive_path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(archive_path, file_name))
+        for file_name in os.listdir(archive_path)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="delete the loose files once they are in the archive",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "pack_raw_archive.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    start = time.time()
+
+    store = ArchiveStore(ARCHIVE_PATH)
+    files, size = 0, 0
+    for dir_name in tqdm(sorted(os.listdir(RAW_DATA_PATH))):
+        if not os.path.isdir(os.path.join(RAW_DATA_PATH, dir_name)):
+            continue
+        try:
+            packed, packed_size = pack_competition(store, dir_name, args.remove)
+        except Exception as e:
+            logging.error(f"Error packing {dir_name}: {e}")
+            continue
+        files += packed
+        size += packed_size
+
+    pruned = store.prune()
+    logging.info(
+        f"Packed {files:,} files ({size / 1e6:,.1f} MB) into {ARCHIVE_PATH} "
+        f"({archive_size(ARCHIVE_PATH) / 1e6:,.1f} MB); {pruned} unreferenced blobs pruned."
+    )
+
+    end = time.time()
+    logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,781 @@
+"""
+This script runs the pipeline (steps 01-10) as a graph of tasks instead of running the scripts one after another.
+Steps 01, 02, 03, 04 and 06 become one task per competition, and the cleaning steps 05 and 07 become one task each,
+depending on the steps 04 and 06 of all competitions; the judge panels (step 08), the database (step 09) and the
+block-judging statistics (step 10) are built last, one task each. Independent competitions move through the steps
+concurrently (e.g. the results of one competition are downloaded while the protocols of another one are parsed):
+downloads run in a thread pool and parsing/cleaning in a process pool.
+
+Every completed task is recorded in a checkpoint manifest (data/pipeline_manifest.json) together with a fingerprint
+of its inputs, so a resumed run skips the tasks that are already done and whose inputs did not change. The download
+tasks (steps 01 and 03) still run every time, since their conditional requests are how changed files are picked up (a
+304 for every unchanged file); the later steps are skipped as usual when the files did not change. With
+--no-revalidate, the downloads are skipped like the other tasks.
+
+The links of the competitions that went through all the per-competition steps are recorded in data/links_manifest.json.
+With --update, only the competitions of comp_links.csv that are not in it (new, failed before or with a changed link)
+are run, and the cleaning steps replace the files of these competitions in the cleaned datasets and the database
+instead of rebuilding them.
+
+With --stream (for a competition that has just finished), steps 03, 04 and 06 of a competition run as one task: the
+judges' pages and protocols go from the downloads straight to the parsers through bounded queues, and the downloaded
+files are saved in the background, only to keep them.
+
+Examples:
+    python pipeline.py --jobs 4
+    python pipeline.py --only-comp wc2014,ec2014 --stages 04,05
+    python pipeline.py --update
+    python pipeline.py --only-comp wc2025 --stream
+"""
+
+import argparse
+import copy
+import importlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import pandas as pd
+from file_paths import (
+    ARCHIVE_PATH,
+    CLEANED_DATA_PATH,
+    DATA_PATH,
+    DATABASE_PATH,
+    LINKS_PATH,
+    LOG_PATH,
+    OUTPUT_FORMAT,
+    RAW_DATA_PATH,
+    RAW_STORAGE,
+)
+from tqdm import tqdm
+from utils.cleaning import extract_comp_type_season
+from utils.database import TABLES, build_database, update_database
+from utils.fetching import Fetcher, add_fetch_arguments
+from utils.parallel import init_worker_logging, worker_log_queue
+from utils.profiling import RunReport, measure
+from utils.raw_store import open_raw_store
+from utils.storage import table_file
+from utils.streaming import DEFAULT_QUEUE_SIZE, stream_downloads
+
+MANIFEST_PATH = os.path.join(DATA_PATH, "pipeline_manifest.json")
+LINKS_MANIFEST_PATH = os.path.join(DATA_PATH, "links_manifest.json")
+
+RAW_STORE = open_raw_store(RAW_STORAGE, ARCHIVE_PATH)
+
+STEP_MODULES = {
+    "01": "01_download_main_page_to_html",
+    "02": "02_link_name_mapping",
+    "03": "03_download_results_to_html_or_pdf",
+    "04": "04_judge_scraping",
+    "05": "05_judge_cleaning",
+    "06": "06_protocol_pdf_scraping",
+    "07": "07_protocol_pdf_cleaning",
+    "08": "08_judge_panels",
+    "09": "09_build_database",
+    "10": "10_block_judging",
+}
+STAGES = list(STEP_MODULES)
+PER_COMPETITION_STAGES = ["01", "02", "03", "04", "06"]
+
+# the step each step reads the outputs of
+PARENT_STAGE = {"02": "01", "03": "02", "04": "03", "05": "04", "06": "03", "07": "06"}
+
+
+def step(stage):
+    return importlib.import_module(STEP_MODULES[stage])
+
+
+### task functions; module-level so that they can be sent to worker processes
+
+
+def run_download_main_page(url, fetcher):
+    failures = step("01").download_webpage(url, RAW_DATA_PATH, fetcher)
+    if failures:
+        raise RuntimeError(f"Failed to download {url}")
+
+
+def run_link_name_mapping(comp):
+    step("02").build_link_name_mapping(comp)
+
+
+def run_download_results(comp, root_url, fetcher):
+    failures = step("03").download_all_results_for_one_competition(
+        comp, root_url, fetcher
+    )
+    if failures:
+        raise RuntimeError(f"{len(failures)} downloads failed for {comp}")
+
+
+def run_judge_scraping(comp, cache):
+    cache = fresh_counters(cache)
+    step("04").extract_judge_table(comp, cache)
+    return {"04": (cache.hits, cache.misses)}
+
+
+def run_protocol_scraping(comp, cache):
+    cache = fresh_counters(cache)
+    _, _, season = extract_comp_type_season(comp)
+    step("06").extract_all_protocols(comp, season, cache)
+    return {"06": (cache.hits, cache.misses)}
+
+
+def run_streamed_results(
+    comp, root_url, fetcher, judge_cache, protocol_cache, queue_size, executor
+):
+    """
+    Steps 03, 04 and 06 of a competition in one pass: every judges' page and protocol is parsed in the executor as
+    soon as it is downloaded (see utils.streaming.stream_downloads). The judges and protocols are saved as by steps
+    04 and 06, and the task fails if a download or a protocol failed.
+    """
+    judge_cache = fresh_counters(judge_cache)
+    protocol_cache = fresh_counters(protocol_cache)
+    _, _, season = extract_comp_type_season(comp)
+
+    judge_keys = step("04").list_judge_files(comp, downloaded_only=False)
+    protocol_keys = step("06").list_protocol_files(comp, downloaded_only=False)
+    parsers = dict()
+    for key in judge_keys:
+        parsers[os.path.join(RAW_DATA_PATH, comp, key)] = (
+            step("04").read_judge_page_streamed,
+            (comp, key, judge_cache, "lxml"),
+        )
+    for key, value in protocol_keys:
+        parsers[os.path.join(RAW_DATA_PATH, comp, key)] = (
+            step("06").extract_one_protocol_streamed,
+            (comp, key, value, season, protocol_cache, "text"),
+        )
+
+    results, failures = stream_downloads(
+        fetcher,
+        step("03").build_jobs_for_one_competition(comp, root_url),
+        parsers,
+        executor,
+        "03",
+        queue_size,
+    )
+
+    errors = [result for result in results.values() if isinstance(result, Exception)]
+    judges, protocols = [], []
+    for key in judge_keys:
+        result = results.get(os.path.join(RAW_DATA_PATH, comp, key))
+        if isinstance(result, tuple):
+            df, hit = result
+            if df is not None:
+                judge_cache.record(hit)
+            judges.append(df)
+    for key, _ in protocol_keys:
+        result = results.get(os.path.join(RAW_DATA_PATH, comp, key))
+        if isinstance(result, tuple):
+            df, hit = result
+            protocol_cache.record(hit)
+            protocols.append(df)
+    step("04").save_judges(comp, judges)
+    step("06").save_protocols(comp, protocols)
+
+    if failures or errors:
+        raise RuntimeError(
+            f"{len(failures)} downloads and {len(errors)} parsers failed for {comp}"
+        )
+    return {
+        "04": (judge_cache.hits, judge_cache.misses),
+        "06": (protocol_cache.hits, protocol_cache.misses),
+    }
+
+
+def run_judge_cleaning(comps=None):
+    if comps is None:
+        step("05").clean_judges()
+    else:
+        step("05").patch_judges(comps)
+
+
+def run_protocol_cleaning(comps=None):
+    if OUTPUT_FORMAT == "parquet":
+        step("07").clean_streaming(incremental=True, comps=comps)
+    else:
+        step("07").clean_all_at_once()
+
+
+def run_judge_panels():
+    step("08").build_judge_panels()
+
+
+def run_database_build(comps=None):
+    if comps is None:
+        build_database(CLEANED_DATA_PATH, DATABASE_PATH)
+    else:
+        update_database(CLEANED_DATA_PATH, DATABASE_PATH, comps)
+
+
+def run_block_judging():
+    step("10").build_block_judging()
+
+
+def run_measured(stage, comp, threaded, func, *args):
+    """Run a task function and record it in the run report."""
+    with measure(stage, comp, threaded=threaded):
+        return func(*args)
+
+
+def fresh_counters(cache):
+    """Copy of the parse cache with zeroed hit/miss counters, so that a task reports only its own counts."""
+    cache = copy.copy(cache)
+    cache.hits = 0
+    cache.misses = 0
+    return cache
+
+
+### inputs of the tasks
+
+
+def mapping_path(comp):
+    return os.path.join(RAW_DATA_PATH, comp, "link_name_mapping.json")
+
+
+def mapping_and_files(comp):
+    """The link name mapping of a competition and all the downloaded files it lists."""
+    paths = [mapping_path(comp)]
+    if os.path.isfile(mapping_path(comp)):
+        with open(mapping_path(comp), "r", encoding="utf-8") as json_file:
+            data = json.load(json_file)
+        paths += [os.path.join(RAW_DATA_PATH, comp, key) for key in data]
+    return paths
+
+
+def tables_of_all_competitions(name):
+    return sorted(
+        file_path
+        for file_path in (
+            table_file(os.path.join(RAW_DATA_PATH, dir_name, name))
+            for dir_name in os.listdir(RAW_DATA_PATH)
+        )
+        if file_path
+    )
+
+
+def cleaned_files(names=("judges", "protocols")):
+    """The files of the given cleaned tables (Parquet datasets, or single Parquet files or pickles)."""
+    paths = []
+    for name in names:
+        root = os.path.join(CLEANED_DATA_PATH, name)
+        for dir_path, _, file_names in os.walk(root):
+            paths += [os.path.join(dir_path, file_name) for file_name in file_names]
+        paths += [root + ".parquet", root + ".pkl"]
+    return sorted(paths)
+
+
+def fingerprint(paths, params):
+    """
+    Fingerprint of the task inputs: the parameters plus size and modification time of every input file (for the files
+    in the raw archive, size and SHA-256).
+    """
+    files = []
+    for path in paths:
+        stat = RAW_STORE.stat(path)
+        files.append([os.path.relpath(path, DATA_PATH), *(stat or (None, None))])
+    return {"params": list(params), "files": files}
+
+
+class Task:
+    """One step for one competition (or one global cleaning step) with its dependencies, inputs and outputs."""
+
+    def __init__(
+        self,
+        stage,
+        comp,
+        func,
+        args,
+        deps,
+        inputs=lambda: [],
+        outputs=lambda: [],
+        params=(),
+        cpu=False,
+        requires_success=True,
+        provides=(),
+        stream=False,
+        always_run=False,
+    ):
+        self.task_id = f"{stage}:{comp}" if comp else stage
+        self.stage = stage
+        self.comp = comp
+        self.func = func
+        self.args = args
+        self.deps = deps
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params
+        self.cpu = cpu
+        # per-competition steps need their parent step to succeed; the cleaning steps run with whatever is there
+        self.requires_success = requires_success
+        # the ids of the tasks this task also does (the streamed downloads do 04 and 06), which end in the same state
+        self.provides = provides
+        # streamed tasks run in the download threads and get the process pool for their parsers as last argument
+        self.stream = stream
+        # the downloads revalidate their files on every run, so that the changed ones are picked up
+        self.always_run = always_run
+
+    def fingerprint(self):
+        return fingerprint(self.inputs(), self.params)
+
+    def is_complete(self, manifest):
+        entry = manifest.get(self.task_id)
+        return (
+            not self.always_run
+            and entry is not None
+            and entry["fingerprint"] == self.fingerprint()
+            and all(RAW_STORE.exists(path) for path in self.outputs())
+        )
+
+
+def resolve_dep_stage(stage, stages):
+    """The nearest selected step whose outputs the given step reads, or None."""
+    parent = PARENT_STAGE.get(stage)
+    while parent is not None and parent not in stages:
+        parent = PARENT_STAGE.get(parent)
+    return parent
+
+
+def build_tasks(
+    comp_links,
+    stages,
+    fetcher,
+    judge_cache,
+    protocol_cache,
+    update=False,
+    stream_queue_size=None,
+):
+    """
+    The tasks of the selected steps for the given competitions. With update=True, the cleaning steps and the database
+    only replace the given competitions instead of rebuilding everything. With a stream_queue_size, steps 03, 04 and
+    06 of each competition are one streamed task (see run_streamed_results).
+    """
+    patched = (list(comp_links),) if update else ()
+    tasks = []
+    for comp, root_url in comp_links.items():
+
+        def dep(stage, comp=comp):
+            parent = resolve_dep_stage(stage, stages)
+            return [f"{parent}:{comp}"] if parent else []
+
+        html_path = os.path.join(RAW_DATA_PATH, comp, f"{comp}.html")
+        if "01" in stages:
+            tasks.append(
+                Task(
+                    "01",
+                    comp,
+                    run_download_main_page,
+                    (root_url, fetcher),
+                    dep("01"),
+                    outputs=lambda html_path=html_path: [html_path],
+                    params=(root_url,),
+                    always_run=fetcher.revalidate,
+                )
+            )
+        if "02" in stages:
+            tasks.append(
+                Task(
+                    "02",
+                    comp,
+                    run_link_name_mapping,
+                    (comp,),
+                    dep("02"),
+                    inputs=lambda html_path=html_path: [html_path],
+                    outputs=lambda comp=comp: [mapping_path(comp)],
+                )
+            )
+        if stream_queue_size:
+            tasks.append(
+                Task(
+                    "03",
+                    comp,
+                    run_streamed_results,
+                    (
+                        comp,
+                        root_url,
+                        fetcher,
+                        judge_cache,
+                        protocol_cache,
+                        stream_queue_size,
+                    ),
+                    dep("03"),
+                    inputs=lambda comp=comp: [mapping_path(comp)],
+                    params=(root_url,),
+                    always_run=fetcher.revalidate,
+                    provides=(f"04:{comp}", f"06:{comp}"),
+                    stream=True,
+                )
+            )
+        if "03" in stages and not stream_queue_size:
+            tasks.append(
+                Task(
+                    "03",
+                    comp,
+                    run_download_results,
+                    (comp, root_url, fetcher),
+                    dep("03"),
+                    inputs=lambda comp=comp: [mapping_path(comp)],
+                    params=(root_url,),
+                    always_run=fetcher.revalidate,
+                )
+            )
+        if "04" in stages and not stream_queue_size:
+            tasks.append(
+                Task(
+                    "04",
+                    comp,
+                    run_judge_scraping,
+                    (comp, judge_cache),
+                    dep("04"),
+                    inputs=lambda comp=comp: mapping_and_files(comp),
+                    cpu=True,
+                )
+            )
+        if "06" in stages and not stream_queue_size:
+            tasks.append(
+                Task(
+                    "06",
+                    comp,
+                    run_protocol_scraping,
+                    (comp, protocol_cache),
+                    dep("06"),
+                    inputs=lambda comp=comp: mapping_and_files(comp),
+                    cpu=True,
+                )
+            )
+
+    for stage, func, table in (
+        ("05", run_judge_cleaning, "judges"),
+        ("07", run_protocol_cleaning, "protocols"),
+    ):
+        if stage in stages:
+            parent = resolve_dep_stage(stage, stages)
+            tasks.append(
+                Task(
+                    stage,
+                    None,
+                    func,
+                    patched,
+                    [f"{parent}:{comp}" for comp in comp_links] if parent else [],
+                    inputs=lambda table=table: tables_of_all_competitions(table),
+                    params=(OUTPUT_FORMAT,),
+                    cpu=True,
+                    requires_success=False,
+                )
+            )
+
+    if "08" in stages:
+        tasks.append(
+            Task(
+                "08",
+                None,
+                run_judge_panels,
+                (),
+                [stage for stage in ("05", "07") if stage in stages],
+                inputs=cleaned_files,
+                outputs=lambda: [
+                    os.path.join(CLEANED_DATA_PATH, name)
+                    + (".parquet" if OUTPUT_FORMAT == "parquet" else ".pkl")
+                    for name in ("judge_panels", "judge_identities")
+                ],
+                cpu=True,
+                requires_success=False,
+            )
+        )
+    if "09" in stages:
+        tasks.append(
+            Task(
+                "09",
+                None,
+                run_database_build,
+                patched,
+                (
+                    ["08"]
+                    if "08" in stages
+                    else [stage for stage in ("05", "07") if stage in stages]
+                ),
+                inputs=lambda: cleaned_files(TABLES),
+                outputs=lambda: [DATABASE_PATH],
+                cpu=True,
+                requires_success=False,
+            )
+        )
+    if "10" in stages:
+        tasks.append(
+            Task(
+                "10",
+                None,
+                run_block_judging,
+                (),
+                (
+                    ["08"]
+                    if "08" in stages
+                    else [stage for stage in ("05", "07") if stage in stages]
+                ),
+                inputs=lambda: cleaned_files(("protocols", "judge_panels")),
+                outputs=lambda: [
+                    os.path.join(CLEANED_DATA_PATH, name)
+                    + (".parquet" if OUTPUT_FORMAT == "parquet" else ".pkl")
+                    for name in step("10").TABLES
+                ],
+                cpu=True,
+                requires_success=False,
+            )
+        )
+
+    return tasks
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.isfile(path):
+        return dict()
+    with open(path, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    with open(path + ".part", "w", encoding="utf-8") as json_file:
+        json.dump(manifest, json_file, indent=4, sort_keys=True)
+    os.replace(path + ".part", path)
+
+
+def diff_comp_links(comp_links, recorded_links):
+    """The competitions of comp_links that are new, whose link changed, and that are no longer listed."""
+    new = [comp for comp in comp_links if comp not in recorded_links]
+    changed = [
+        comp
+        for comp in comp_links
+        if comp in recorded_links and recorded_links[comp] != comp_links[comp]
+    ]
+    removed = [comp for comp in recorded_links if comp not in comp_links]
+    return new, changed, removed
+
+
+def record_links(recorded_links, comp_links, stages, state):
+    """Record the links of the competitions that went through all the per-competition steps in this run."""
+    if not all(stage in stages for stage in PER_COMPETITION_STAGES):
+        return
+    for comp, link in comp_links.items():
+        if all(
+            state.get(f"{stage}:{comp}") in ("done", "skipped")
+            for stage in PER_COMPETITION_STAGES
+        ):
+            recorded_links[comp] = link
+    save_manifest(recorded_links, LINKS_MANIFEST_PATH)
+
+
+def run_tasks(tasks, jobs, force=False, caches=None):
+    """
+    Run the tasks as soon as their dependencies are finished, skipping the ones recorded as complete in the manifest.
+    Returns the final state of every task: done, skipped (already complete), failed or blocked (a dependency failed).
+    The hit/miss counts returned by the parsing tasks ({stage: (hits, misses)}) are added to the parse cache of their
+    step in caches.
+    """
+    caches = caches or dict()
+    manifest = load_manifest()
+    pending = {task.task_id: task for task in tasks}
+    state = dict()
+    running = dict()
+    progress = tqdm(total=len(tasks))
+
+    def set_state(task, value):
+        for task_id in (task.task_id, *task.provides):
+            state[task_id] = value
+
+    with worker_log_queue() as queue, ThreadPoolExecutor(
+        max_workers=jobs
+    ) as io_executor, ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker_logging, initargs=(queue,)
+    ) as cpu_executor:
+        while pending or running:
+            # schedule every task whose dependencies are finished
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for task in list(pending.values()):
+                    dep_states = [state.get(dep) for dep in task.deps]
+                    if any(s is None for s in dep_states):
+                        continue
+                    del pending[task.task_id]
+                    scheduled = True
+
+                    if task.requires_success and any(
+                        s in ("failed", "blocked") for s in dep_states
+                    ):
+                        set_state(task, "blocked")
+                        logging.warning(
+                            f"{task.task_id}: skipped, a dependency failed."
+                        )
+                        progress.update()
+                        continue
+
+                    if not force and task.is_complete(manifest):
+                        set_state(task, "skipped")
+                        progress.update()
+                        continue
+
+                    executor = cpu_executor if task.cpu else io_executor
+                    future = executor.submit(
+                        run_measured,
+                        task.stage,
+                        task.comp,
+                        not task.cpu,
+                        task.func,
+                        *task.args,
+                        *((cpu_executor,) if task.stream else ()),
+                    )
+                    running[future] = (task, task.fingerprint())
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, task_fingerprint = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    set_state(task, "failed")
+                    logging.error(f"{task.task_id}: {e}")
+                else:
+                    set_state(task, "done")
+                    manifest[task.task_id] = {
+                        "fingerprint": task_fingerprint,
+                        "completed": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+                    save_manifest(manifest)
+                    for stage, (hits, misses) in (result or dict()).items():
+                        if stage in caches:
+                            caches[stage].hits += hits
+                            caches[stage].misses += misses
+                progress.update()
+
+    progress.close()
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--only-comp",
+        help="comma-separated competitions to run, e.g. wc2014,ec2014 (default: all in comp_links.csv)",
+    )
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help="comma-separated steps to run, e.g. 04,05 (default: all)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="number of tasks running concurrently"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run the selected tasks even if the manifest records them as complete",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="only run the competitions of comp_links.csv that are new or changed since the last run, and patch the "
+        "cleaned outputs with them",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse the judges' pages and protocols as they are downloaded instead of reading them back from disk "
+        "(steps 03, 04 and 06 run as one task per competition)",
+    )
+    parser.add_argument(
+        "--stream-queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="with --stream, the number of downloaded files that may wait for a parser (and to be saved) before the "
+        "downloads wait",
+    )
+    add_fetch_arguments(parser)
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",")]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {unknown}. Choose from {STAGES}.")
+    if args.stream and not all(stage in stages for stage in ("03", "04", "06")):
+        parser.error("--stream runs steps 03, 04 and 06 together; select all three.")
+
+    logging.basicConfig(
+        filename=os.path.join(LOG_PATH, "pipeline.log"),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filemode="w",
+        level=logging.INFO,
+    )
+
+    report = RunReport(LOG_PATH, "pipeline").install()
+
+    start = time.time()
+
+    links = pd.read_csv(LINKS_PATH)
+    comp_links = {link.split("/")[-2]: link for link in links["links"]}
+    if args.only_comp:
+        only = [comp.strip() for comp in args.only_comp.split(",")]
+        missing = [comp for comp in only if comp not in comp_links]
+        if missing:
+            parser.error(f"Competitions not in {LINKS_PATH}: {missing}")
+        comp_links = {comp: comp_links[comp] for comp in only}
+
+    recorded_links = load_manifest(LINKS_MANIFEST_PATH)
+    if args.update:
+        new, changed, removed = diff_comp_links(comp_links, recorded_links)
+        logging.info(
+            f"Update: {len(new)} new and {len(changed)} changed competitions: {new + changed}"
+        )
+        if removed:
+            logging.warning(
+                f"No longer in {LINKS_PATH}, left in the cleaned outputs: {removed}"
+            )
+        comp_links = {comp: comp_links[comp] for comp in new + changed}
+        if not comp_links:
+            logging.info("Nothing to update.")
+            report.write()
+            return
+
+    fetcher = Fetcher.from_args(args, progress=False, store=RAW_STORE)
+    caches = {
+        "04": step("04").open_parse_cache(),
+        "06": step("06").open_parse_cache(),
+    }
+
+    tasks = build_tasks(
+        comp_links,
+        stages,
+        fetcher,
+        caches["04"],
+        caches["06"],
+        args.update,
+        args.stream_queue_size if args.stream else None,
+    )
+    state = run_tasks(tasks, args.jobs, args.force, caches)
+    record_links(recorded_links, comp_links, stages, state)
+
+    for stage, cache in caches.items():
+        if stage in stages:
+            cache.log_stats()
+    if "06" in stages:
+        step("06").log_page_text_stats(report.rows)
+    report.write()
+
+    counts = pd.Series(state).value_counts().to_dict()
+    logging.info(f"Tasks: {counts}")
+    end = time.time()
+    logging.info("Total time taken: {:.2f} minutes".format((end - start) / 60))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+This script serves already downloaded competitions (e.g. data/raw/wc2014) over HTTP so that the download stages can be
+exercised locally without hitting isuresults.com. A request for .../{comp_name_abbre}/ returns the main results page
+{comp_name_abbre}/{comp_name_abbre}.html and a request for .../{comp_name_abbre}/{file} returns {comp_name_abbre}/{file}.
+
+Example:
+    python stand_in_server.py --port 8000
+    # then point data/links/comp_links.csv to http://127.0.0.1:8000/results/wc2014/
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from file_paths import RAW_DATA_PATH
+
+
+def resolve_path(root, url_path):
+    """Map a request path to a file under root, or None if it does not exist."""
+    parts = [p for p in unquote(urlparse(url_path).path).split("/") if p]
+    if not parts:
+        return None
+
+    if url_path.endswith("/"):
+        dir_name = parts[-1]
+        file_path = os.path.join(root, dir_name, f"{dir_name}.html")
+    elif len(parts) >= 2:
+        file_path = os.path.join(root, parts[-2], parts[-1])
+    else:
+        return None
+
+    file_path = os.path.realpath(file_path)
+    if not file_path.startswith(os.path.realpath(root)) or not os.path.isfile(
+        file_path
+    ):
+        return None
+    return file_path
+
+
+def not_modified(headers, etag, mtime):
+    """Evaluate the conditional request headers against the file's ETag and modification time."""
+    if headers.get("If-None-Match"):
+        return headers["If-None-Match"] == etag
+    if headers.get("If-Modified-Since"):
+        try:
+            since = parsedate_to_datetime(headers["If-Modified-Since"]).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def make_handler(root, latency, fail_rate):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if latency > 0:
+                time.sleep(latency)
+            if random.random() < fail_rate:
+                self.send_error(503)
+                return
+
+            file_path = resolve_path(root, self.path)
+            if file_path is None:
+                self.send_error(404)
+                return
+
+            with open(file_path, "rb") as file:
+                body = file.read()
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            mtime = os.path.getmtime(file_path)
+
+            if not_modified(self.headers, etag, mtime):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+            if file_path.lower().endswith(".pdf"):
+                self.send_header("Content-Type", "application/pdf")
+            else:
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=RAW_DATA_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds to wait before answering"
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0,
+        help="share of requests answered with 503 to exercise retries",
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(args.root, args.latency, args.fail_rate)
+    )
+    print(f"Serving {args.root} on http://{args.host}:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
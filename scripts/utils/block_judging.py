@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+# a competition segment, as in the judge panels of step 08
+SEGMENT_COLUMNS = ["comp", "discipline", "program", "junior", "team"]
+
+# one element or component of one skater's program: the marks of the panel that step 07 standardizes together
+ITEM_COLUMNS = ["comp", "source", "rank", "element", "element_order"]
+
+PROTOCOL_COLUMNS = list(
+    dict.fromkeys(
+        SEGMENT_COLUMNS
+        + ITEM_COLUMNS
+        + ["component", "nation", "judge_id", "judge_score", "judge_score_std"]
+    )
+)
+
+PANEL_COLUMNS = SEGMENT_COLUMNS + ["judge_id", "judge_key", "Nation2", "anonymous"]
+
+# ISU trimmed mean: the highest and the lowest mark of the panel are dropped when there are at least this many marks
+MIN_MARKS_TO_TRIM = 3
+
+
+def group_codes(df, keys):
+    """Group code of every row (0, 1, ... in key order) and the keys of every group, in code order."""
+    grouped = df.groupby(keys, observed=True, dropna=False, sort=True)
+    return grouped.ngroup().to_numpy(), grouped.size().reset_index()[keys]
+
+
+def shared_codes(*series):
+    """Codes of several Series over their common set of values (-1 for missing values)."""
+    values = pd.unique(pd.concat([s.astype(object) for s in series]).dropna())
+    return [pd.Categorical(s.astype(object), categories=values).codes for s in series]
+
+
+class BlockJudging:
+    """
+    Block-judging statistics of the cleaned protocols, computed with NumPy over group codes instead of groupby loops:
+
+    - judge_bias: per judge, the mean standardized score (judge_score_std) given to skaters of the judge's own nation
+      and to the other skaters, and the difference (bias);
+    - panel_deviations: per judge of every competition segment and component (TES / PCS), the mean and mean absolute
+      deviation of the judge's marks from the trimmed mean of the panel (highest and lowest mark dropped);
+    - judge_pairs: per pair of judges who sat on the same panels, the mean product of their standardized scores on the
+      elements and components they both marked (co_deviation; positive when they deviate from the panel together).
+
+    The judges are the ones resolved by step 08 (judge_panels). Before the 2016-2017 season the judge numbers were
+    randomized, so their marks are only attributed to judges with include_anonymous=True.
+    """
+
+    def __init__(self, df_protocols, df_panels, include_anonymous=False):
+        df = df_protocols[df_protocols["judge_score"].notna()]
+        self.item, _ = group_codes(df, ITEM_COLUMNS)
+        self.segment, self.segments = group_codes(df, SEGMENT_COLUMNS)
+        self.seat, seats = group_codes(df, SEGMENT_COLUMNS + ["judge_id"])
+        self.slot, slots = pd.factorize(df["judge_id"], use_na_sentinel=False)
+        self.n_slots = len(slots)
+        self.component, self.components = pd.factorize(
+            df["component"], use_na_sentinel=False
+        )
+        self.score = df["judge_score"].to_numpy(dtype=float)
+        self.score_std = df["judge_score_std"].to_numpy(dtype=float)
+
+        # the judge (key and nation) of every seat, i.e. judge number of a segment
+        panels = df_panels[PANEL_COLUMNS].copy()
+        if not include_anonymous:
+            panels.loc[panels["anonymous"], ["judge_key", "Nation2"]] = None
+        self.seats = seats.astype(object).merge(
+            panels.astype(object), on=SEGMENT_COLUMNS + ["judge_id"], how="left"
+        )
+        self.seat_judge, self.judge_keys = pd.factorize(self.seats["judge_key"])
+        self.seat_nation, self.nation = shared_codes(
+            self.seats["Nation2"], df["nation"]
+        )
+
+    def judge_bias(self):
+        judge = self.seat_judge[self.seat]
+        judge_nation = self.seat_nation[self.seat]
+        valid = (
+            (judge >= 0)
+            & (judge_nation >= 0)
+            & (self.nation >= 0)
+            & ~np.isnan(self.score_std)
+        )
+        same = judge_nation[valid] == self.nation[valid]
+        bins = judge[valid] * 2 + same
+        n = 2 * len(self.judge_keys)
+        marks = np.bincount(bins, minlength=n).reshape(-1, 2)
+        sums = np.bincount(bins, weights=self.score_std[valid], minlength=n).reshape(
+            -1, 2
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / marks
+
+        nations = (
+            pd.DataFrame(
+                {"judge_key": self.seats["judge_key"], "nation": self.seats["Nation2"]}
+            )
+            .dropna()
+            .groupby("judge_key")["nation"]
+            .agg(lambda nations: nations.mode().iloc[0])
+        )
+        df = pd.DataFrame(
+            {
+                "judge_key": self.judge_keys,
+                "marks_same_nation": marks[:, 1],
+                "marks_other_nations": marks[:, 0],
+                "score_std_same_nation": means[:, 1],
+                "score_std_other_nations": means[:, 0],
+            }
+        )
+        df.insert(1, "nation", df["judge_key"].map(nations))
+        df["bias"] = df["score_std_same_nation"] - df["score_std_other_nations"]
+        return df[marks.sum(axis=1) > 0].reset_index(drop=True)
+
+    def trimmed_means(self):
+        """The trimmed mean of the panel's marks for every item."""
+        order = np.argsort(self.item, kind="stable")
+        items = self.item[order]
+        scores = self.score[order]
+        starts = np.flatnonzero(np.r_[True, items[1:] != items[:-1]])
+        highest = np.maximum.reduceat(scores, starts)
+        lowest = np.minimum.reduceat(scores, starts)
+        marks = np.bincount(items, minlength=len(starts))
+        total = np.bincount(items, weights=scores, minlength=len(starts))
+        trim = marks >= MIN_MARKS_TO_TRIM
+        return np.where(
+            trim,
+            (total - highest - lowest) / np.where(trim, marks - 2, 1),
+            total / marks,
+        )
+
+    def panel_deviations(self):
+        deviation = self.score - self.trimmed_means()[self.item]
+        bins = self.seat * len(self.components) + self.component
+        n = len(self.seats) * len(self.components)
+        marks = np.bincount(bins, minlength=n)
+        mean_deviation = np.bincount(bins, weights=deviation, minlength=n) / np.maximum(
+            marks, 1
+        )
+        mean_abs_deviation = np.bincount(
+            bins, weights=np.abs(deviation), minlength=n
+        ) / np.maximum(marks, 1)
+
+        seat, component = np.divmod(np.arange(n), len(self.components))
+        df = self.seats.iloc[seat][
+            SEGMENT_COLUMNS + ["judge_id", "judge_key", "Nation2"]
+        ].reset_index(drop=True)
+        df = df.rename(columns={"Nation2": "judge_nation"})
+        df["component"] = self.components[component]
+        df["marks"] = marks
+        df["mean_deviation"] = mean_deviation
+        df["mean_abs_deviation"] = mean_abs_deviation
+        return df[marks > 0].reset_index(drop=True)
+
+    def judge_pairs(self):
+        # the standardized marks of every item as a matrix with one column per judge number, and the seat of every
+        # judge number of every segment
+        n_items = self.item.max() + 1 if len(self.item) else 0
+        marks = np.full((n_items, self.n_slots), np.nan)
+        marks[self.item, self.slot] = self.score_std
+        item_segment = np.zeros(n_items, dtype=np.int64)
+        item_segment[self.item] = self.segment
+        segment_seat = np.full((len(self.segments), self.n_slots), -1)
+        segment_seat[self.segment, self.slot] = self.seat
+
+        empty = np.array([], dtype=np.int64)
+        first, second, sums, counts = [empty], [empty], [empty], [empty]
+        for a in range(self.n_slots):
+            for b in range(a + 1, self.n_slots):
+                product = marks[:, a] * marks[:, b]
+                valid = ~np.isnan(product)
+                count = np.bincount(item_segment[valid], minlength=len(self.segments))
+                total = np.bincount(
+                    item_segment[valid],
+                    weights=product[valid],
+                    minlength=len(self.segments),
+                )
+                segments = np.flatnonzero(count)
+                first.append(segment_seat[segments, a])
+                second.append(segment_seat[segments, b])
+                sums.append(total[segments])
+                counts.append(count[segments])
+        first = self.seat_judge[np.concatenate(first)]
+        second = self.seat_judge[np.concatenate(second)]
+        sums = np.concatenate(sums)
+        counts = np.concatenate(counts)
+
+        valid = (first >= 0) & (second >= 0) & (first != second)
+        low = np.minimum(first, second)[valid]
+        high = np.maximum(first, second)[valid]
+        pairs, pair = np.unique(
+            low.astype(np.int64) * len(self.judge_keys) + high, return_inverse=True
+        )
+        items = np.bincount(pair, weights=counts[valid], minlength=len(pairs))
+        df = pd.DataFrame(
+            {
+                "judge_key_1": self.judge_keys[pairs // len(self.judge_keys)],
+                "judge_key_2": self.judge_keys[pairs % len(self.judge_keys)],
+                "panels": np.bincount(pair, minlength=len(pairs)),
+                "items": items.astype(np.int64),
+                "co_deviation": np.bincount(
+                    pair, weights=sums[valid], minlength=len(pairs)
+                )
+                / items,
+            }
+        )
+        return df.sort_values("co_deviation", ascending=False, ignore_index=True)
@@ -1,4 +1,9 @@
+import logging
 import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
 
 
 def extract_comp_type_season(comp):
@@ -82,3 +87,124 @@ def generate_junior_indicator(category, comp_name):
         return True
 
     return False
+
+
+### vectorized versions of the functions above, operating on whole Series
+
+
+def map_unique(series, func):
+    """Apply a scalar function once per unique value of the series and map the results back to the rows."""
+    unique = pd.unique(series)
+    return series.map(dict(zip(unique, map(func, unique))))
+
+
+def judge_key(name):
+    """
+    Canonical key of a judge's name that is the same across its spelling variants: accents, case, punctuation and the
+    order of the names are ignored, so "Jae-Eun CHUNG", "CHUNG Jae Eun" and "Jae Eun Chung" all give "chung eun jae".
+    """
+    if not isinstance(name, str):
+        return None
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(sorted(re.findall(r"[a-z0-9]+", ascii_name.lower()))) or None
+
+
+def extract_comp_type_season_series(comp):
+    """Vectorized extract_comp_type_season: computed once per unique competition and mapped back to the rows."""
+    unique = pd.Series(pd.unique(comp))
+    values = pd.DataFrame(
+        unique.map(extract_comp_type_season).tolist(),
+        columns=["comp_type", "year", "season"],
+        index=unique,
+    )
+    return (
+        comp.map(values["comp_type"]),
+        comp.map(values["year"]),
+        comp.map(values["season"]),
+    )
+
+
+def contains_any(series, patterns):
+    """Whether each value contains one of the patterns; False for missing values."""
+    mask = np.zeros(len(series), dtype=bool)
+    for pattern in patterns:
+        mask |= series.str.contains(pattern, regex=False, na=False).to_numpy(dtype=bool)
+    return mask
+
+
+def extract_discipline_series(category):
+    """Vectorized extract_discipline."""
+    return pd.Series(
+        np.select(
+            [
+                contains_any(category, ("women", "ladies")),
+                contains_any(category, ("men",)),
+                contains_any(category, ("pair",)),
+                contains_any(category, ("ice danc",)),
+            ],
+            ["women", "men", "pair", "ice dance"],
+            default=None,
+        ),
+        index=category.index,
+    )
+
+
+def extract_program_series(category, source):
+    """Vectorized extract_program: the category takes precedence over the source file name."""
+    source = source.str.lower()
+    return pd.Series(
+        np.select(
+            [
+                contains_any(
+                    category,
+                    (
+                        "short program",
+                        "rhythm dance",
+                        "short dance",
+                        "compulsory dance",
+                    ),
+                ),
+                contains_any(category, ("free skating", "free dance")),
+                contains_any(category, ("original dance",)),
+                contains_any(source, ("_sp_", "_rd_", "_sd_", "-qual", "_cd_")),
+                contains_any(source, ("_fs_", "_fd_", "-fnl")),
+                contains_any(source, ("_od_",)),
+            ],
+            ["sp", "lp", "od", "sp", "lp", "od"],
+            default=None,
+        ),
+        index=category.index,
+    )
+
+
+def generate_junior_indicator_series(category, comp_name):
+    """Vectorized generate_junior_indicator."""
+    return comp_name.isin(("wjc", "jgp", "jgpf", "wyog")) | category.str.contains(
+        "junior", regex=False, na=False
+    )
+
+
+def apply_schema(df, schema):
+    """
+    Return df with the columns and dtypes of schema (column -> dtype), in schema order. Numeric columns that hold
+    strings (e.g. the element order "0" of invalid elements) are parsed first; values that are not numbers become
+    missing, as for the judges' scores, and are counted in the log. Narrowing to float32 is only meant for columns
+    whose values are exact in float32; a warning is logged if it changes any value.
+    """
+    df = df.reindex(columns=list(schema))
+    for col, dtype in schema.items():
+        if dtype in ("category", "bool"):
+            continue
+        if df[col].dtype == object:
+            values = pd.to_numeric(df[col], errors="coerce")
+            dropped = (values.isna() & df[col].notna()).sum()
+            if dropped:
+                logging.warning(f"{col}: {dropped} values that are not numbers")
+            df[col] = values
+        if dtype == "float32":
+            changed = (df[col].astype("float32").astype("float64") != df[col]) & df[
+                col
+            ].notna()
+            if changed.any():
+                logging.warning(f"{col}: {changed.sum()} values changed in float32")
+    return df.astype(schema)
@@ -0,0 +1,269 @@
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+from utils.cleaning import judge_key
+from utils.storage import iter_cleaned, table_exists
+
+TABLES = ("judges", "protocols", "judge_panels", "judge_identities")
+
+# the tables built by step 08, left out of the database if that step has not been run
+OPTIONAL_TABLES = ("judge_panels", "judge_identities")
+
+# indexes for the lookups below: the panel of a competition segment, a person by name and nation, and the season
+INDEXES = {
+    "judges": {
+        "judges_panel": ["comp", "discipline", "program", "judge_id"],
+        "judges_name": ["Name", "Nation"],
+        "judges_season": ["season"],
+    },
+    "protocols": {
+        "protocols_panel": ["comp", "discipline", "program", "judge_id"],
+        "protocols_name": ["name", "nation"],
+        "protocols_season": ["season"],
+    },
+    "judge_panels": {
+        "judge_panels_panel": ["comp", "discipline", "program", "judge_id"],
+        "judge_panels_key": ["judge_key"],
+    },
+    "judge_identities": {
+        "judge_identities_key": ["judge_key"],
+    },
+}
+
+# a judge of the judges table gave the scores of the protocol rows of the same competition segment and judge number
+JOIN_CONDITION = " AND ".join(
+    f"p.{col} = j.{col}"
+    for col in ["comp", "discipline", "program", "junior", "team", "judge_id"]
+)
+
+# the same for the judge panels of step 08 (jp), which give every protocol judge number a resolved judge
+PANEL_JOIN_CONDITION = " AND ".join(
+    f"p.{col} = jp.{col}"
+    for col in ["comp", "discipline", "program", "junior", "team", "judge_id"]
+)
+
+
+def insert_table(conn, table, cleaned_path, batch_size, comps=None):
+    """Append the rows of a cleaned table (optionally of some competitions only) to a table. Returns the row count."""
+    count = 0
+    for df in iter_cleaned(table, cleaned_path, batch_size, comps=comps):
+        df.to_sql(table, conn, if_exists="append", index=False)
+        count += len(df)
+    return count
+
+
+def create_indexes(conn, table):
+    for index, columns in INDEXES[table].items():
+        conn.execute(f"CREATE INDEX {index} ON {table} ({', '.join(columns)})")
+
+
+def open_unjournaled(tmp_path):
+    # the file is only moved into place once complete, so it does not need a journal
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+
+def build_database(cleaned_path, db_path, batch_size=100_000):
+    """
+    Load the cleaned judges and protocols, and the judge panels if step 08 has been run, into a SQLite database at
+    db_path and index them (see INDEXES). The tables are read and inserted in batches, and the database is built next
+    to db_path and moved into place at the end, so readers never see a half-built database. Returns the number of rows
+    of each table.
+    """
+    tmp_path = db_path + ".part"
+    if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+
+    counts = dict()
+    with closing(open_unjournaled(tmp_path)) as conn:
+        for table in TABLES:
+            if table in OPTIONAL_TABLES and not table_exists(
+                os.path.join(cleaned_path, table)
+            ):
+                continue
+            counts[table] = insert_table(conn, table, cleaned_path, batch_size)
+            create_indexes(conn, table)
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    os.replace(tmp_path, db_path)
+    return counts
+
+
+def update_database(cleaned_path, db_path, comps, batch_size=100_000):
+    """
+    Replace the rows of the given competitions in the judges and protocols of the database at db_path with those of
+    the cleaned tables, and reload the judge panels of step 08, which are rebuilt on every run. As in build_database,
+    a copy of the database is updated and moved into place at the end. Builds the database if there is none yet.
+    Returns the number of rows inserted into each table.
+    """
+    if not os.path.isfile(db_path):
+        return build_database(cleaned_path, db_path, batch_size)
+
+    tmp_path = db_path + ".part"
+    shutil.copyfile(db_path, tmp_path)
+
+    counts = dict()
+    placeholders = ", ".join("?" * len(comps))
+    with closing(open_unjournaled(tmp_path)) as conn:
+        for table in TABLES:
+            if table in OPTIONAL_TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+                if not table_exists(os.path.join(cleaned_path, table)):
+                    continue
+                counts[table] = insert_table(conn, table, cleaned_path, batch_size)
+                create_indexes(conn, table)
+            else:
+                conn.execute(
+                    f"DELETE FROM {table} WHERE comp IN ({placeholders})", list(comps)
+                )
+                counts[table] = insert_table(
+                    conn, table, cleaned_path, batch_size, comps
+                )
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    os.replace(tmp_path, db_path)
+    return counts
+
+
+def connect(db_path):
+    """Open the database read-only."""
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(
+            f"No database at {db_path}; build it with 09_build_database.py first."
+        )
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def judge_filter(name, nation=None, seasons=None):
+    """WHERE clause and parameters selecting a judge by name, optionally by nation (as listed or imputed) and seasons."""
+    clauses = ["j.Name = ?"]
+    params = [name]
+    if nation is not None:
+        clauses.append("? IN (j.Nation, j.Nation2)")
+        params.append(nation)
+    if seasons is not None:
+        seasons = list(seasons)
+        clauses.append(f"j.season IN ({', '.join('?' * len(seasons))})")
+        params += seasons
+    return " AND ".join(clauses), params
+
+
+def judge_panels(conn, name, nation=None, seasons=None):
+    """The competition segments a judge sat on, with their judge number."""
+    where, params = judge_filter(name, nation, seasons)
+    return pd.read_sql_query(
+        f"""
+        SELECT j.season, j.comp, j.discipline, j.program, j.junior, j.team, j.judge_id, j.Nation, j.Nation2
+        FROM judges AS j
+        WHERE {where}
+        ORDER BY j.season, j.comp, j.discipline, j.program
+        """,
+        conn,
+        params=params,
+    )
+
+
+def judge_scores(conn, name, nation=None, seasons=None):
+    """
+    All scores given by a judge: one row per protocol row (element or component) the judge scored, with the skater's
+    name and nation and the judge's score, raw and standardized within the panel. Judge numbers were randomized in
+    the protocols before the 2016-2017 season, so only the scores from then on belong to the named judge.
+    """
+    where, params = judge_filter(name, nation, seasons)
+    return pd.read_sql_query(
+        f"""
+        SELECT j.Name AS judge_name, j.Nation AS judge_nation, j.Nation2 AS judge_nation2, p.*
+        FROM judges AS j
+        JOIN protocols AS p ON {JOIN_CONDITION}
+        WHERE {where}
+        """,
+        conn,
+        params=params,
+    )
+
+
+def judge_scores_by_nation(conn, name, nation=None, seasons=None):
+    """
+    The scores of a judge summarized by the nation of the skaters: number of scores, mean score and mean standardized
+    score, and whether the skaters are of the judge's own nation. A judge who favours some nations (block judging)
+    gives their skaters a higher mean standardized score than the rest of the panel.
+    """
+    where, params = judge_filter(name, nation, seasons)
+    return pd.read_sql_query(
+        f"""
+        SELECT p.nation,
+            p.nation = COALESCE(j.Nation2, j.Nation) AS same_nation,
+            COUNT(p.judge_score) AS scores,
+            AVG(p.judge_score) AS mean_score,
+            AVG(p.judge_score_std) AS mean_score_std
+        FROM judges AS j
+        JOIN protocols AS p ON {JOIN_CONDITION}
+        WHERE {where}
+        GROUP BY p.nation, same_nation
+        ORDER BY mean_score_std DESC
+        """,
+        conn,
+        params=params,
+    )
+
+
+def panel_scores(conn, comp, discipline=None, program=None):
+    """The scores of all judges of a competition (optionally one discipline / program), with the judges' names."""
+    clauses = ["p.comp = ?"]
+    params = [comp]
+    if discipline is not None:
+        clauses.append("p.discipline = ?")
+        params.append(discipline)
+    if program is not None:
+        clauses.append("p.program = ?")
+        params.append(program)
+    return pd.read_sql_query(
+        f"""
+        SELECT j.Name AS judge_name, j.Nation AS judge_nation, j.Nation2 AS judge_nation2, p.*
+        FROM protocols AS p
+        LEFT JOIN judges AS j ON {JOIN_CONDITION}
+        WHERE {' AND '.join(clauses)}
+        """,
+        conn,
+        params=params,
+    )
+
+
+def find_judges(conn, name):
+    """The judges whose name matches the given one up to accents, case and the order of first and last names."""
+    return pd.read_sql_query(
+        "SELECT * FROM judge_identities WHERE judge_key = ?",
+        conn,
+        params=[judge_key(name)],
+    )
+
+
+def judge_key_scores(conn, key, seasons=None):
+    """
+    All scores given by the judge with the given judge_key (see find_judges), across the spellings of the judge's
+    name: one row per protocol row the judge scored. Only the judge numbers resolved to a single judge are used.
+    """
+    clauses = ["jp.judge_key = ?", "jp.resolution = 'matched'"]
+    params = [key]
+    if seasons is not None:
+        seasons = list(seasons)
+        clauses.append(f"jp.season IN ({', '.join('?' * len(seasons))})")
+        params += seasons
+    return pd.read_sql_query(
+        f"""
+        SELECT jp.judge_key, jp.Name AS judge_name, jp.Nation AS judge_nation, jp.Nation2 AS judge_nation2,
+            jp.anonymous, p.*
+        FROM judge_panels AS jp
+        JOIN protocols AS p ON {PANEL_JOIN_CONDITION}
+        WHERE {' AND '.join(clauses)}
+        """,
+        conn,
+        params=params,
+    )
@@ -0,0 +1,324 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from utils.profiling import measure
+from utils.raw_store import FileStore
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 4.0  # requests per second, per host
+DEFAULT_BURST = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0  # seconds, doubled after every failed attempt
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+METADATA_FILE_NAME = "download_metadata.json"
+
+# url: full url to fetch; file_path: where to save the body;
+# binary: save the raw bytes (PDFs) instead of the decoded text (HTML)
+FetchJob = namedtuple("FetchJob", ["url", "file_path", "binary"])
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts of up to `burst` requests."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Keep one token bucket per host so that every host is rate limited independently."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = dict()
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        if not self.rate or self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+
+class MetadataStore:
+    """
+    Sidecar metadata (ETag, Last-Modified, content length, SHA-256) of the downloaded files. The metadata of all files
+    in a competition directory is kept in a single download_metadata.json file in that directory.
+    """
+
+    def __init__(self):
+        self.directories = dict()
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def _load(self, dir_path):
+        if dir_path not in self.directories:
+            metadata_path = os.path.join(dir_path, METADATA_FILE_NAME)
+            if os.path.isfile(metadata_path):
+                with open(metadata_path, "r", encoding="utf-8") as json_file:
+                    self.directories[dir_path] = json.load(json_file)
+            else:
+                self.directories[dir_path] = dict()
+        return self.directories[dir_path]
+
+    def get(self, file_path):
+        dir_path, file_name = os.path.split(file_path)
+        with self.lock:
+            return self._load(dir_path).get(file_name)
+
+    def set(self, file_path, entry):
+        dir_path, file_name = os.path.split(file_path)
+        with self.lock:
+            self._load(dir_path)[file_name] = entry
+            self.dirty.add(dir_path)
+
+    def save(self):
+        with self.lock:
+            for dir_path in self.dirty:
+                metadata_path = os.path.join(dir_path, METADATA_FILE_NAME)
+                with open(metadata_path + ".part", "w", encoding="utf-8") as json_file:
+                    json.dump(self.directories[dir_path], json_file, indent=4)
+                os.replace(metadata_path + ".part", metadata_path)
+            self.dirty = set()
+
+
+def conditional_headers(entry):
+    """Build If-None-Match / If-Modified-Since headers from the stored metadata."""
+    headers = dict()
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+class Fetcher:
+    """
+    Download many URLs concurrently with per-host rate limiting and retries with exponential backoff.
+
+    Every worker thread keeps its own pooled session, so connections to a host are reused (keep-alive) across files.
+    Files that already exist are revalidated with a conditional GET based on the stored ETag / Last-Modified, and are
+    only rewritten if the server returns a body with a different SHA-256. With revalidate=False, existing files are
+    skipped without any request. The bodies are saved through the store (utils.raw_store): as loose files, or in the
+    raw archive.
+    """
+
+    def __init__(
+        self,
+        workers=DEFAULT_WORKERS,
+        rate=DEFAULT_RATE,
+        burst=DEFAULT_BURST,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        timeout=60,
+        revalidate=True,
+        progress=True,
+        store=None,
+    ):
+        self.workers = max(workers, 1)
+        self.limiter = HostRateLimiter(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.revalidate = revalidate
+        self.progress = progress
+        self.metadata = MetadataStore()
+        self.store = store or FileStore()
+        self.local = threading.local()
+
+    @classmethod
+    def from_args(cls, args, timeout=60, progress=True, store=None):
+        return cls(
+            workers=args.workers,
+            rate=args.rate,
+            retries=args.retries,
+            timeout=timeout,
+            revalidate=not args.no_revalidate,
+            progress=progress,
+            store=store,
+        )
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+        return self.local.session
+
+    def get(self, url, headers=None):
+        """GET the url, retrying on connection errors and retryable status codes."""
+        attempt = 0
+        while True:
+            self.limiter.acquire(url)
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} Error for url: {url}", response=response
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                error = e
+
+            if attempt >= self.retries:
+                raise error
+            delay = self.backoff * (2**attempt) * (1 + random.random())
+            logging.info(f"Retrying {url} in {delay:.1f}s after error: {error}")
+            time.sleep(delay)
+            attempt += 1
+
+    def fetch(self, job):
+        """Fetch one job and return the outcome: downloaded, updated, unchanged, not modified or skipped."""
+        return self.fetch_body(job)[0]
+
+    def fetch_body(self, job):
+        """Fetch one job and return (outcome, body); the body is None if it was not downloaded (skipped, not modified)."""
+        exists = self.store.exists(job.file_path)
+        if exists and not self.revalidate:
+            return "skipped", None
+
+        entry = self.metadata.get(job.file_path) if exists else None
+        response = self.get(job.url, headers=conditional_headers(entry))
+
+        if response.status_code == 304:
+            return "not modified", None
+
+        body = response.content if job.binary else response.text.encode("utf-8")
+        sha = hashlib.sha256(body).hexdigest()
+
+        if not exists:
+            outcome = "downloaded"
+        elif self.store.sha256(job.file_path) == sha:
+            outcome = "unchanged"
+        else:
+            outcome = "updated"
+            logging.info(f"{job.file_path} differs from the server copy; replacing it.")
+
+        if outcome != "unchanged":
+            self.store.write(job.file_path, body)
+
+        self.metadata.set(
+            job.file_path,
+            {
+                "url": job.url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_length": len(body),
+                "sha256": sha,
+            },
+        )
+        return outcome, body
+
+    def fetch_measured(self, job, stage):
+        """Fetch one job and record it in the run report of the given stage."""
+        with measure(
+            stage,
+            os.path.basename(os.path.dirname(job.file_path)),
+            os.path.basename(job.file_path),
+            threaded=True,
+        ) as row:
+            row["outcome"] = self.fetch(job)
+        return row["outcome"]
+
+    def fetch_all(self, jobs, desc=None, stage="download"):
+        """Fetch all jobs concurrently and return the list of (job, error) pairs that failed."""
+        failures = []
+        if not jobs:
+            return failures
+
+        outcomes = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.fetch_measured, job, stage): job for job in jobs
+            }
+            for future in tqdm(
+                as_completed(futures),
+                total=len(futures),
+                desc=desc,
+                disable=not self.progress,
+            ):
+                job = futures[future]
+                try:
+                    outcomes[future.result()] += 1
+                except Exception as e:
+                    logging.error(f"Error downloading {job.url}: {e}")
+                    failures.append((job, e))
+
+        self.metadata.save()
+        logging.info(
+            "Download outcomes: "
+            + ", ".join(f"{key}: {value}" for key, value in sorted(outcomes.items()))
+            + f", failed: {len(failures)}"
+        )
+
+        return failures
+
+
+def add_fetch_arguments(parser):
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="number of concurrent downloads",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help="maximum requests per second per host (0 disables rate limiting)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="number of retries for failed requests",
+    )
+    parser.add_argument(
+        "--no-revalidate",
+        action="store_true",
+        help="skip files that already exist instead of sending conditional requests",
+    )
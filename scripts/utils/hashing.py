@@ -0,0 +1,9 @@
+import hashlib
+
+
+def sha256_of_file(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
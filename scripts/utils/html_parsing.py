@@ -0,0 +1,55 @@
+from lxml import etree, html
+
+HTML_PARSERS = ("lxml", "html.parser")
+
+# the text nodes below an element that BeautifulSoup's get_text() returns: comments and the contents of scripts and
+# style sheets are left out
+TEXT_NODES = etree.XPath(".//text()[not(ancestor::script) and not(ancestor::style)]")
+
+
+def read_html(file_path, store=None):
+    """
+    Parse an HTML file with lxml. As for BeautifulSoup, the file is decoded as UTF-8 before parsing. With a store
+    (utils.raw_store), the file is read through it, e.g. from the raw archive.
+    """
+    if store is not None:
+        return html.document_fromstring(store.read_text(file_path))
+    with open(file_path, encoding="utf8") as file:
+        return html.document_fromstring(file.read())
+
+
+def element_text(element):
+    """The text of an element, as the .text of the corresponding BeautifulSoup tag."""
+    return "".join(TEXT_NODES(element))
+
+
+def element_html(element):
+    """The markup of an element, without the text that follows it."""
+    return html.tostring(element, encoding="unicode", with_tail=False)
+
+
+def flatten_nested_tables(table):
+    """
+    Replace the tables nested in a table (e.g. the nation cells of the judges' tables) by spans with their text, in
+    place, so that pd.read_html only builds a DataFrame for the outer table. The cells keep the text that
+    pd.read_html reads from them, and a span keeps the style of its table, so hidden tables stay hidden.
+    """
+    nested = table.find(".//table")
+    while nested is not None:
+        span = html.Element("span")
+        span.text = nested.text_content()
+        span.tail = nested.tail
+        if nested.get("style") is not None:
+            span.set("style", nested.get("style"))
+        nested.getparent().replace(nested, span)
+        nested = table.find(".//table")
+    return table
+
+
+def add_html_parser_arguments(parser):
+    parser.add_argument(
+        "--html-parser",
+        choices=HTML_PARSERS,
+        default="lxml",
+        help="lxml (fast; falls back to html.parser for pages it cannot parse) or BeautifulSoup with html.parser",
+    )
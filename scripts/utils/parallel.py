@@ -0,0 +1,30 @@
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+
+def init_worker_logging(queue):
+    """Process pool initializer: send all log records of the worker to the parent process."""
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(queue)]
+    root.setLevel(logging.INFO)
+
+
+@contextmanager
+def worker_log_queue():
+    """
+    Yield a queue that worker processes log into (see init_worker_logging). The records are written by the
+    handlers of the parent's root logger, so all workers end up in the same log file as the parent.
+    """
+    manager = multiprocessing.Manager()
+    queue = manager.Queue()
+    listener = QueueListener(
+        queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+    try:
+        yield queue
+    finally:
+        listener.stop()
+        manager.shutdown()
@@ -0,0 +1,104 @@
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import shutil
+
+from utils.raw_store import FileStore
+
+
+def source_version(*objects):
+    """
+    Version string of a parser: a hash of the source code of the given modules / functions. Any change to the
+    parsing logic changes the version and therefore invalidates the cached results.
+    """
+    sha = hashlib.sha256()
+    for obj in objects:
+        sha.update(inspect.getsource(obj).encode("utf-8"))
+    return sha.hexdigest()[:16]
+
+
+class ParseCache:
+    """
+    Persistent cache of per-file parse results, keyed by the SHA-256 of the file content, the parser version and
+    the parsing context (e.g. competition, file name and season).
+
+    Entries are pickled under {cache_path}/{name}/{version}/. Invalidation policy: when the parser version changes,
+    the directories of all other versions of the same cache are evicted the first time the cache is opened. The
+    SHA-256 of a file comes from the store of the downloaded files (for the raw archive, from its index).
+    """
+
+    def __init__(self, cache_path, name, version, enabled=True, store=None):
+        self.path = os.path.join(cache_path, name, version)
+        self.name = name
+        self.version = version
+        self.enabled = enabled
+        self.store = store or FileStore()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        if self.enabled:
+            self.evict_stale_versions()
+            os.makedirs(self.path, exist_ok=True)
+
+    def evict_stale_versions(self):
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            return
+        for version in os.listdir(parent):
+            if version != self.version:
+                shutil.rmtree(os.path.join(parent, version), ignore_errors=True)
+                self.evicted += 1
+
+    def key(self, file_sha, context):
+        return hashlib.sha256(f"{file_sha}|{context!r}".encode("utf-8")).hexdigest()
+
+    def get(self, file_sha, context):
+        """Return (True, result) on a hit and (False, None) on a miss. Does not update the hit/miss counters."""
+        if not self.enabled:
+            return False, None
+        entry_path = os.path.join(self.path, self.key(file_sha, context) + ".pkl")
+        try:
+            with open(entry_path, "rb") as file:
+                return True, pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+    def put(self, file_sha, context, result):
+        if not self.enabled:
+            return
+        entry_path = os.path.join(self.path, self.key(file_sha, context) + ".pkl")
+        tmp_path = f"{entry_path}.{os.getpid()}.part"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def cached(self, file_path, context, func, *args, file_sha=None):
+        """
+        Return (result, hit): the cached result of func(*args) for the file, computing and storing it on a miss. The
+        SHA-256 of the content can be given, e.g. for a body that is not saved yet.
+        """
+        if not self.enabled:
+            return func(*args), False
+        file_sha = file_sha or self.store.sha256(file_path)
+        hit, result = self.get(file_sha, context)
+        if not hit:
+            result = func(*args)
+            self.put(file_sha, context, result)
+        return result, hit
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        logging.info(
+            f"Parse cache {self.name} (version {self.version}): {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1%} hit rate), {self.evicted} stale versions evicted."
+        )
@@ -1,74 +1,260 @@
 import logging
 import re
+from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
+# the (J)GP protocols of the 2004 season come out of the PDF with their columns and lines in reverse order
+REVERSED_COMPS = re.compile(r"j?gp")
+REVERSED_SEASON = 2004
+
+NUMBER = re.compile(r"^\d+(\.\d+)?$")
+MARKS = re.compile(r"^([!qe<*>SFxX][|\s]?)*[!qe<*>SFxX]$")
+
+# columns are separated by two or more spaces
+COLUMN_SEPARATOR = re.compile(r" {2,}")
+
+# word box engine: words closer than COLUMN_GAP word heights belong to the same column (a space is about 0.25 word
+# heights wide, columns are at least one word height apart) and words whose vertical centers are within
+# ROW_TOLERANCE word heights belong to the same row
+COLUMN_GAP = 0.6
+ROW_TOLERANCE = 0.3
+
+ENGINES = ("text", "words")
+
+# columns of the parsed protocol rows, in output order; the judges' scores j1, j2, ... come between the element
+# columns and the row columns, and the skater columns are the same on all rows of a skater
+ELEMENT_COLUMNS = ["element_order", "element", "base_value", "goe"]
+ROW_COLUMNS = ["panel_score", "marks", "second_half", "component", "factor"]
+SKATER_COLUMNS = ["rank", "name", "nation", "stn", "tss", "tes", "pcs", "deductions"]
+# kept as object columns even where they happen to be empty in a whole protocol
+TEXT_COLUMNS = ["element", "marks", "second_half", "component", "name", "nation"]
+
+# float() only accepts strings starting with a digit, a sign, a dot, the first letter of inf / nan or whitespace
+FLOAT_FIRST_CHARS = frozenset("0123456789+-.iInN")
+
 
 def convert_to_float(text):
     """Convert a string to float if possible, otherwise return the string."""
+    first = text[:1]
+    if first not in FLOAT_FIRST_CHARS and not (first.isdecimal() or first.isspace()):
+        # cannot be a number; skips the cost of the exception for element names, marks, etc.
+        return text
     try:
         return float(text)
     except ValueError:
         return text
 
 
-def refine_column_split(line):
+def split_number_column(column):
     """for example, if a column is 5.3 x, split it to 5.3 and x"""
-    new_line = []
-    for item in line:
-        if isinstance(item, (int, float)):
-            new_line.append(item)
-            continue
-        items = item.split(" ")
-        if re.search(r"^\d+(\.\d+)?$", items[0]):
-            new_line += [convert_to_float(i) for i in items]
-        else:
-            new_line.append(item)
-    return new_line
+    items = column.split(" ")
+    if NUMBER.search(items[0]):
+        return [convert_to_float(item) for item in items]
+    return [column]
 
 
-def split_line_to_columns(line, comp, season):
-    """Split lines to columns and only keep relevant lines."""
-    line = line.split("  ")
-    line = [i.strip() for i in line]
-    result = [convert_to_float(i) for i in line if i != ""]
+def reverses_columns(comp, season):
+    return season == REVERSED_SEASON and REVERSED_COMPS.search(comp) is not None
 
-    if re.search(r"j?gp", comp) and season == 2004:
-        result.reverse()
 
-    if not result:
-        return None
-    if not isinstance(result[-1], float):
+def tokenize_line(line, reverse=False):
+    """Split a line to columns and only keep relevant lines (see tokenize_columns)."""
+    tokens = [token for token in map(str.strip, COLUMN_SEPARATOR.split(line)) if token]
+    return tokenize_columns(tokens, reverse)
+
+
+def tokenize_columns(tokens, reverse=False):
+    """
+    Convert the columns of a line and only keep relevant lines, i.e. lines whose last column is a number. The columns
+    are converted and split (see split_number_column) in a single pass, after checking the last column so that
+    irrelevant lines are dropped early. reverse=True reverses the columns (see reverses_columns).
+    """
+    if not tokens:
         return None
+    if reverse:
+        tokens.reverse()
 
-    # fix wrongly parsed first columns
-    if (not isinstance(result[0], float)) and result[0][0].isdigit():
-        result = result[0].split(" ", 1) + result[1:]
-        result[0] = convert_to_float(result[0])
+    last = convert_to_float(tokens[-1])
+    if not isinstance(last, float):
+        return None
+    if len(tokens) == 1:
+        return [last]
+
+    first = convert_to_float(tokens[0])
+    if isinstance(first, float) or not first[0].isdigit():
+        result = [first]
+    else:
+        # fix wrongly parsed first columns
+        first = first.split(" ", 1)
+        result = [convert_to_float(first[0])]
+        if len(first) == 2:
+            result += split_number_column(first[1])
 
     # all floats and integers should be in a single column
-    result = refine_column_split(result)
+    for token in tokens[1:-1]:
+        value = convert_to_float(token)
+        if isinstance(value, str) and " " in token and token[0].isdecimal():
+            result += split_number_column(token)
+        else:
+            result.append(value)
+    result.append(last)
 
     return result
 
 
-def get_results_all_pages(doc, comp, season):
-    """Extract results from all pages of the document and separate to skaters."""
-    ### extract texts
+def split_line_to_columns(line, comp, season):
+    """Split lines to columns and only keep relevant lines."""
+    return tokenize_line(line, reverses_columns(comp, season))
+
+
+class PageTextCache:
+    """
+    Memo of the text layers of the pages of one PDF (PyMuPDF's get_text, e.g. the sorted text or the word boxes), so
+    that a page read by several steps (the first page check, the category and the parser) is only extracted once.
+    Only the last max_pages extracted pages are kept, since the parser reads the pages in order and only the first
+    page is read more than once. The hits and misses are counted.
+    """
+
+    def __init__(self, doc, max_pages=2):
+        self.doc = doc
+        self.max_pages = max_pages
+        self.texts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_text(self, number, option="text", sort=False):
+        key = (number, option, sort)
+        if key in self.texts:
+            self.hits += 1
+            self.texts.move_to_end(key)
+            return self.texts[key]
+        self.misses += 1
+        text = self.doc[number].get_text(option, sort=sort)
+        self.texts[key] = text
+        if len(self.texts) > self.max_pages:
+            self.texts.popitem(last=False)
+        return text
+
+
+class CachedPage:
+    """A page whose get_text goes through a PageTextCache."""
+
+    def __init__(self, cache, number):
+        self.cache = cache
+        self.number = number
+
+    @property
+    def page(self):
+        """The PyMuPDF page itself."""
+        return self.cache.doc[self.number]
+
+    def get_text(self, option="text", sort=False):
+        return self.cache.get_text(self.number, option, sort)
+
+
+class CachedDocument:
+    """
+    Some pages of a PDF (all of them by default) as a sequence of CachedPage, with the same iteration, indexing and
+    slicing as a PyMuPDF document, so that the parsing functions take either.
+    """
+
+    def __init__(self, doc, numbers=None, cache=None):
+        self.cache = cache if cache is not None else PageTextCache(doc)
+        self.numbers = range(doc.page_count) if numbers is None else numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        for number in self.numbers:
+            yield CachedPage(self.cache, number)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CachedDocument(self.cache.doc, self.numbers[index], self.cache)
+        return CachedPage(self.cache, self.numbers[index])
+
+
+def extract_text_lines(doc):
+    """Extract the text lines of all pages of the document."""
     results = []
     for page in doc:
         results += page.get_text(sort=True).splitlines()
+    return results
 
+
+def split_lines(results, comp, season):
+    """Split the text lines to columns, keeping only the relevant lines in reading order."""
+    reverse = reverses_columns(comp, season)
     lines = []
     for line in results:
-        line = split_line_to_columns(line, comp, season)
+        line = tokenize_line(line, reverse)
         if line:
             lines.append(line)
 
-    if re.search(r"j?gp", comp) and season == 2004:
+    if reverse:
         lines.reverse()
 
-    ### separate skaters
+    return lines
+
+
+def page_word_rows(page):
+    """
+    Extract the rows of a page from the word bounding boxes: words are grouped into rows by their vertical center and
+    into columns by the horizontal gap between them, so the columns do not have to be guessed from runs of spaces in
+    the page text. Returns the rows as lists of column strings, top to bottom, left to right.
+    """
+    words = sorted(
+        page.get_text("words"), key=lambda word: (word[1] + word[3], word[0])
+    )
+
+    page_rows = []
+    row_center = None
+    for word in words:
+        x0, y0, x1, y1, text = word[:5]
+        center = (y0 + y1) / 2
+        if row_center is None or abs(center - row_center) > ROW_TOLERANCE * (y1 - y0):
+            page_rows.append([])
+            row_center = center
+        page_rows[-1].append((x0, x1, y1 - y0, text))
+
+    rows = []
+    for row in page_rows:
+        row.sort()
+        columns = []
+        right = None
+        for x0, x1, height, text in row:
+            if right is not None and x0 - right < COLUMN_GAP * height:
+                columns[-1] += " " + text
+            else:
+                columns.append(text)
+            right = x1
+        rows.append(columns)
+    return rows
+
+
+def extract_word_rows(doc):
+    """Extract the rows of all pages of the document from the word bounding boxes (see page_word_rows)."""
+    rows = []
+    for page in doc:
+        rows += page_word_rows(page)
+    return rows
+
+
+def split_rows(rows):
+    """Convert the rows of columns, keeping only the relevant lines."""
+    lines = []
+    for row in rows:
+        line = tokenize_columns(row)
+        if line:
+            lines.append(line)
+    return lines
+
+
+def separate_skaters(lines):
+    """Separate the lines to skaters: a new skater starts where a text line is followed by a line starting with a number."""
     new_skater_index = []
     for i, line in enumerate(lines[:-1]):
         if isinstance(line[0], str) and isinstance(lines[i + 1][0], float):
@@ -77,7 +263,6 @@ def get_results_all_pages(doc, comp, season):
     if not new_skater_index:
         return [lines]
 
-    ### seperate skaters
     skaters = []
     current_index = 0
     for index in new_skater_index:
@@ -88,13 +273,69 @@ def get_results_all_pages(doc, comp, season):
     return skaters
 
 
+def get_results_all_pages(doc, comp, season, engine="text"):
+    """
+    Extract results from all pages of the document and separate to skaters. The engine is either "text" (columns
+    split at runs of spaces in the page text) or "words" (columns from the word bounding boxes, see
+    extract_word_rows). The reversed protocols of the 2004 (J)GP events always use the text engine.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine {engine}; choose from {ENGINES}.")
+
+    if engine == "words" and not reverses_columns(comp, season):
+        lines = split_rows(extract_word_rows(doc))
+    else:
+        lines = split_lines(extract_text_lines(doc), comp, season)
+    return separate_skaters(lines)
+
+
+def iter_lines(doc, comp, season, engine="text"):
+    """Yield the relevant lines of the document, extracting one page at a time (not for reversed protocols)."""
+    for page in doc:
+        if engine == "words":
+            yield from split_rows(page_word_rows(page))
+        else:
+            yield from split_lines(page.get_text(sort=True).splitlines(), comp, season)
+
+
+def iter_skaters(doc, comp, file_name, season, engine="text"):
+    """
+    Yield the skaters of the document as Skater records while the pages are read, so that the lines of the whole
+    document are never held at once and a skater can be processed before the rest of the document is extracted. A
+    skater whose lines straddle a page boundary is only yielded once the line starting the next skater is read (same
+    rule as separate_skaters). The reversed protocols of the 2004 (J)GP events are read at once, since their lines
+    come in reverse order.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine {engine}; choose from {ENGINES}.")
+
+    if reverses_columns(comp, season):
+        skaters = get_results_all_pages(doc, comp, season)
+    else:
+        skaters = iter_skater_lines(iter_lines(doc, comp, season, engine))
+
+    for skater in skaters:
+        if skater:
+            yield Skater(skater, comp, file_name, season)
+
+
+def iter_skater_lines(lines):
+    """Lazy version of separate_skaters: yield the lines of one skater at a time."""
+    skater = []
+    for line in lines:
+        if skater and isinstance(skater[-1][0], str) and isinstance(line[0], float):
+            yield skater
+            skater = []
+        skater.append(line)
+    if skater:
+        yield skater
+
+
 def find_marks(row):
     """Find marks in the row."""
     marks = []
     for item in row[2:]:
-        if isinstance(item, str) and (
-            re.search(r"^([!qe<*>SFxX][|\s]?)*[!qe<*>SFxX]$", item)
-        ):
+        if isinstance(item, str) and MARKS.search(item):
             marks.append(item)
     return marks
 
@@ -130,6 +371,67 @@ def fix_first_row(row, dir_name, file_name, season):
     return row
 
 
+def convert_judge_score(value):
+    """A judge's score as a float (decimal commas are accepted), or NaN if the judge did not score, e.g. "-"."""
+    if isinstance(value, float):
+        return value
+    if value is None:
+        return np.nan
+    try:
+        return float(value.replace(",", "."))
+    except ValueError:
+        return np.nan
+
+
+class SkaterRows:
+    """
+    The parsed rows of one skater in a compact form (see Skater.to_rows): the row columns as lists, the judges'
+    scores as a float array with one row per element or component and one column per judge, and the skater columns
+    (SKATER_COLUMNS) once rather than repeated on every row.
+    """
+
+    __slots__ = ("columns", "judges", "skater")
+
+    def __init__(self, columns, judges, skater):
+        self.columns = columns
+        self.judges = judges
+        self.skater = skater
+
+    def __len__(self):
+        return len(self.judges)
+
+
+def rows_to_dataframe(rows):
+    """
+    Build a single DataFrame from the SkaterRows of a protocol, with the judges' scores in float columns j1, j2, ...
+    (NaN where a judge did not score or a skater had fewer judges).
+    """
+    n_rows = sum(len(skater) for skater in rows)
+    n_judges = max(skater.judges.shape[1] for skater in rows)
+    judges = np.full((n_rows, n_judges), np.nan)
+    start = 0
+    for skater in rows:
+        judges[start : start + len(skater), : skater.judges.shape[1]] = skater.judges
+        start += len(skater)
+
+    data = dict()
+    for column in ELEMENT_COLUMNS:
+        data[column] = [value for skater in rows for value in skater.columns[column]]
+    for j in range(n_judges):
+        data[f"j{j + 1}"] = judges[:, j]
+    for column in ROW_COLUMNS:
+        data[column] = [value for skater in rows for value in skater.columns[column]]
+    for i, column in enumerate(SKATER_COLUMNS):
+        data[column] = [
+            value for skater in rows for value in [skater.skater[i]] * len(skater)
+        ]
+
+    for column in TEXT_COLUMNS:
+        data[column] = np.array(data[column], dtype=object)
+
+    return pd.DataFrame(data)
+
+
 class Skater:
     """Class to represent a skater."""
 
@@ -167,8 +469,20 @@ class Skater:
         self.tes = self.result[1:tes_index]
         self.pcs = self.result[tes_index + 1 : pcs_index]
 
-    def tes_to_dataframe(self):
-        """Convert TES to a DataFrame."""
+    def check_lengths(self, rows, name):
+        """Return the length of the longest row, logging the rows if they have different lengths."""
+        max_length = max(len(item) for item in rows)
+        if not all(len(item) == max_length for item in rows):
+            logging.info(
+                f"{name} items have different lengths for {self.dir_name} - {self.file_name}"
+            )
+            logging.info(self.first_row)
+            for item in rows:
+                logging.info(item)
+        return max_length
+
+    def clean_tes(self):
+        """Clean the TES rows in place and return their marks and second half indicators."""
         for row in self.tes:
             if (
                 isinstance(row[0], float)
@@ -199,69 +513,59 @@ class Skater:
                     item.remove(m)
                 marks[i] = " ".join(mark)
 
-        # check if all items have the same length
-        max_length = max(len(item) for item in self.tes)
-        if not all(len(item) == max_length for item in self.tes):
-            logging.info(
-                f"TES items have different lengths for {self.dir_name} - {self.file_name}"
-            )
-            logging.info(self.first_row)
-            for item in self.tes:
-                logging.info(item)
-
-        columns = (
-            ["element_order", "element", "base_value", "goe"]
-            + [f"j{i}" for i in range(1, max_length - 4)]
-            + ["panel_score"]
-        )
-        df_tes = pd.DataFrame(self.tes, columns=columns)
-        df_tes["marks"] = marks
-        df_tes["second_half"] = second_half
-        df_tes["component"] = "TES"
-
-        self.df_tes = df_tes
-
-    def pcs_to_dataframe(self):
-        """Convert PCS to a DataFrame."""
-        # sanity check: each item should have the same number of elements
-        max_length = max(len(item) for item in self.pcs)
-        columns = (
-            ["element", "factor"]
-            + [f"j{i}" for i in range(1, max_length - 2)]
-            + ["panel_score"]
-        )
-        if not all(len(item) == max_length for item in self.pcs):
-            logging.info(
-                f"PCS items have different lengths for {self.dir_name} - {self.file_name}"
-            )
-            logging.info(self.first_row)
-            for item in self.pcs:
-                logging.info(item)
-
-        df_pcs = pd.DataFrame(self.pcs, columns=columns)
-        df_pcs["component"] = "PCS"
-        self.df_pcs = df_pcs
+        return marks, second_half
 
-    def to_dataframe(self):
-        """Convert the skater's data to a DataFrame."""
+    def to_rows(self):
+        """
+        Convert the skater's data to SkaterRows. The columns are positional: a TES row is element order, element,
+        base value, GOE, the judges' scores and the panel score; a PCS row is component, factor, the judges' scores
+        and the panel score. Rows shorter than the longest row of their table are padded with None.
+        """
         ### extract first row, tes and pcs
         self.split_result()
-        self.tes_to_dataframe()
-        self.pcs_to_dataframe()
+        marks, second_half = self.clean_tes()
+        tes_length = self.check_lengths(self.tes, "TES")
+        pcs_length = self.check_lengths(self.pcs, "PCS")
 
-        df = pd.concat([self.df_tes, self.df_pcs], ignore_index=True)
+        n_tes = len(self.tes)
+        judges = np.full(
+            (n_tes + len(self.pcs), max(tes_length - 5, pcs_length - 3)), np.nan
+        )
+        columns = {column: [] for column in ELEMENT_COLUMNS + ROW_COLUMNS}
+
+        for i, row in enumerate(self.tes):
+            row = row + [None] * (tes_length - len(row))
+            columns["element_order"].append(row[0])
+            columns["element"].append(row[1])
+            columns["base_value"].append(row[2])
+            columns["goe"].append(row[3])
+            judges[i, : tes_length - 5] = [convert_judge_score(v) for v in row[4:-1]]
+            columns["panel_score"].append(row[-1])
+        columns["marks"] += marks
+        columns["second_half"] += second_half
+        columns["component"] += ["TES"] * n_tes
+        columns["factor"] += [np.nan] * n_tes
+
+        for i, row in enumerate(self.pcs, start=n_tes):
+            row = row + [None] * (pcs_length - len(row))
+            columns["element"].append(row[0])
+            columns["factor"].append(row[1])
+            judges[i, : pcs_length - 3] = [convert_judge_score(v) for v in row[2:-1]]
+            columns["panel_score"].append(row[-1])
+        for column in ("element_order", "base_value", "goe", "marks", "second_half"):
+            columns[column] += [np.nan] * len(self.pcs)
+        columns["component"] += ["PCS"] * len(self.pcs)
 
         ### common columns
-        df["rank"] = self.first_row[0]
-        df["name"] = self.first_row[1]
-        df["nation"] = self.first_row[2]
         if self.season >= 2009 or self.dir_name in ("wjc2009", "wc2009"):
-            df["stn"] = self.first_row[3]
+            stn = self.first_row[3]
         else:
-            df["stn"] = None
-        df["tss"] = self.first_row[-4]
-        df["tes"] = self.first_row[-3]
-        df["pcs"] = self.first_row[-2]
-        df["deductions"] = self.first_row[-1]
+            stn = None
+        skater = (self.first_row[0], self.first_row[1], self.first_row[2], stn)
+        skater += tuple(self.first_row[-4:])
 
-        return df
+        return SkaterRows(columns, judges, skater)
+
+    def to_dataframe(self):
+        """Convert the skater's data to a DataFrame (see to_rows and rows_to_dataframe)."""
+        return rows_to_dataframe([self.to_rows()])
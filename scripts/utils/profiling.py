@@ -0,0 +1,171 @@
+import cProfile
+import csv
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+REPORT_COLUMNS = [
+    "stage",
+    "comp",
+    "file",
+    "status",
+    "wall_s",
+    "cpu_s",
+    "read_bytes",
+    "written_bytes",
+    "peak_rss_mb",
+    "pid",
+]
+
+logger = logging.getLogger("profiling")
+
+
+def io_counters():
+    """Bytes read and written by this process so far (from /proc, so Linux only; None elsewhere)."""
+    try:
+        with open("/proc/self/io", "r") as file:
+            fields = dict(line.split(": ") for line in file.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextmanager
+def measure(stage, comp=None, file=None, threaded=False):
+    """
+    Measure the enclosed block and log it as one row of the run report (see RunReport). The yielded dict can be
+    extended with extra columns, e.g. row["cache_hit"] = hit.
+
+    CPU time and bytes read/written are counted for the whole process, so for blocks running in concurrent threads
+    (threaded=True) only the wall time and the CPU time of the thread are recorded. Peak RSS is the high-water mark of
+    the process at the end of the block.
+    """
+    row = {"stage": stage, "comp": comp, "file": file, "status": "ok"}
+    read_start, written_start = (None, None) if threaded else io_counters()
+    cpu_start = time.thread_time() if threaded else time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield row
+    except BaseException:
+        row["status"] = "error"
+        raise
+    finally:
+        row["wall_s"] = round(time.perf_counter() - wall_start, 4)
+        cpu_end = time.thread_time() if threaded else time.process_time()
+        row["cpu_s"] = round(cpu_end - cpu_start, 4)
+        if not threaded:
+            read_end, written_end = io_counters()
+            if read_start is not None and read_end is not None:
+                row["read_bytes"] = read_end - read_start
+                row["written_bytes"] = written_end - written_start
+            row["peak_rss_mb"] = peak_rss_mb()
+        row["pid"] = os.getpid()
+        logger.info(
+            f"{stage} {comp or ''} {file or ''}: {row['wall_s']:.2f}s",
+            extra={"measurement": row},
+        )
+
+
+def is_not_measurement(record):
+    return not hasattr(record, "measurement")
+
+
+class RunReport(logging.Handler):
+    """
+    Collects the measurements logged by measure(), both in this process and in worker processes (whose records
+    reach the parent through utils.parallel.worker_log_queue), and writes them to {name}_report.json and
+    {name}_report.csv in the log directory. The measurements are kept out of the other log handlers.
+
+    Install the report after logging.basicConfig and before opening a worker log queue.
+    """
+
+    def __init__(self, log_path, name):
+        super().__init__()
+        self.json_path = os.path.join(log_path, f"{name}_report.json")
+        self.csv_path = os.path.join(log_path, f"{name}_report.csv")
+        self.name = name
+        self.rows = []
+
+    def emit(self, record):
+        measurement = getattr(record, "measurement", None)
+        if measurement is not None:
+            self.rows.append(measurement)
+
+    def install(self):
+        root = logging.getLogger()
+        for handler in root.handlers:
+            handler.addFilter(is_not_measurement)
+        root.addHandler(self)
+        return self
+
+    def write(self, slowest=10):
+        """Write the report files and log the slowest files of the run."""
+        columns = REPORT_COLUMNS + sorted(
+            {col for row in self.rows for col in row} - set(REPORT_COLUMNS)
+        )
+        with open(self.json_path, "w", encoding="utf-8") as json_file:
+            json.dump({"script": self.name, "rows": self.rows}, json_file, indent=1)
+        with open(self.csv_path, "w", encoding="utf-8", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+        files = [row for row in self.rows if row.get("file")]
+        files.sort(key=lambda row: row["wall_s"], reverse=True)
+        for row in files[:slowest]:
+            logging.info(
+                f"Slow file: {row['comp']} - {row['file']} ({row['stage']}): {row['wall_s']:.2f}s wall, "
+                f"{row['cpu_s']:.2f}s CPU"
+            )
+        logging.info(
+            f"Run report with {len(self.rows)} rows written to {self.csv_path}"
+        )
+
+
+@contextmanager
+def profile(file_path, top=30):
+    """Run the enclosed block under cProfile, dump the stats to file_path and log the top functions."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(file_path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top)
+        logging.info(f"Profile written to {file_path}:\n{stream.getvalue()}")
+
+
+def add_profiling_arguments(parser):
+    parser.add_argument(
+        "--profile-comp",
+        default=None,
+        help="process only this competition (e.g. wc2014), serially and under cProfile; "
+        "the stats are written to logs/{script}_{comp}.prof",
+    )
+
+
+def profile_competition(args, log_path, name):
+    """The cProfile context for the competition selected with --profile-comp, or a no-op context."""
+    if args.profile_comp is None:
+        return nullcontext()
+    return profile(os.path.join(log_path, f"{name}_{args.profile_comp}.prof"))
@@ -0,0 +1,296 @@
+import hashlib
+import io
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pyarrow as pa
+from utils.cleaning import extract_comp_type_season
+from utils.hashing import sha256_of_file
+
+RAW_STORAGES = ("files", "archive")
+
+COMPRESSION = "zstd"
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    comp TEXT NOT NULL, link TEXT NOT NULL, sha256 TEXT NOT NULL, PRIMARY KEY (comp, link)
+);
+"""
+
+
+def decode_text(body):
+    """Decode an HTML body as open(file_path, encoding="utf8") reads the file, with universal newlines."""
+    return io.TextIOWrapper(io.BytesIO(body), encoding="utf8").read()
+
+
+class FileStore:
+    """
+    The downloaded pages and PDFs as loose files: {RAW_DATA_PATH}/{comp}/{link}. A body that is not saved yet can be
+    served in place of the file with streamed (see utils.streaming).
+    """
+
+    def __init__(self):
+        self.streamed_bodies = dict()
+
+    @contextmanager
+    def streamed(self, file_path, body):
+        """Read the given body for file_path inside the block, whether or not the file is saved."""
+        self.streamed_bodies[file_path] = body
+        try:
+            yield
+        finally:
+            self.streamed_bodies.pop(file_path, None)
+
+    def exists(self, file_path):
+        return file_path in self.streamed_bodies or os.path.exists(file_path)
+
+    def read(self, file_path):
+        if file_path in self.streamed_bodies:
+            return self.streamed_bodies[file_path]
+        with open(file_path, "rb") as file:
+            return file.read()
+
+    def read_text(self, file_path):
+        if file_path in self.streamed_bodies:
+            return decode_text(self.streamed_bodies[file_path])
+        with open(file_path, encoding="utf8") as file:
+            return file.read()
+
+    def open_pdf(self, file_path):
+        import fitz
+
+        if file_path in self.streamed_bodies:
+            return fitz.open(stream=self.streamed_bodies[file_path], filetype="pdf")
+        return fitz.open(file_path)
+
+    def write(self, file_path, body):
+        """Write the body to a temporary file first so that an interrupted run never leaves a partial file."""
+        tmp_path = file_path + ".part"
+        with open(tmp_path, "wb") as file:
+            file.write(body)
+        os.replace(tmp_path, file_path)
+
+    def sha256(self, file_path):
+        if file_path in self.streamed_bodies:
+            return hashlib.sha256(self.streamed_bodies[file_path]).hexdigest()
+        return sha256_of_file(file_path)
+
+    def stat(self, file_path):
+        """(size, version) of a file, or None if it does not exist; the version changes whenever the content does."""
+        if not os.path.isfile(file_path):
+            return None
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+
+class ArchiveStore(FileStore):
+    """
+    The downloaded pages and PDFs in one SQLite pack per season: {archive_path}/raw_{season}.sqlite. Every body is
+    stored once per pack, zstd-compressed and addressed by its SHA-256 (blobs), and the files table maps each
+    (comp, link) to its blob, so the pages that repeat across events (e.g. the lists of officials) take no extra
+    space. Files that are not in the archive, e.g. downloaded before switching to it, are read from disk.
+
+    Every thread and process opens its own connections; the packs are in WAL mode so that the parsing steps can read
+    a pack while the downloads write to it.
+    """
+
+    def __init__(self, archive_path):
+        super().__init__()
+        self.archive_path = archive_path
+        self.connections = dict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"archive_path": self.archive_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["archive_path"])
+
+    @staticmethod
+    def key(file_path):
+        return os.path.basename(os.path.dirname(file_path)), os.path.basename(file_path)
+
+    @staticmethod
+    def season(comp):
+        try:
+            return extract_comp_type_season(comp)[2]
+        except (AttributeError, TypeError, ValueError):
+            return "other"
+
+    def pack_path(self, comp):
+        return os.path.join(self.archive_path, f"raw_{self.season(comp)}.sqlite")
+
+    def connection(self, comp):
+        path = self.pack_path(comp)
+        conn_key = (os.getpid(), threading.get_ident(), path)
+        with self.lock:
+            conn = self.connections.get(conn_key)
+            if conn is None:
+                os.makedirs(self.archive_path, exist_ok=True)
+                conn = sqlite3.connect(path, timeout=60)
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+                conn.executescript(ARCHIVE_SCHEMA)
+                self.connections[conn_key] = conn
+        return conn
+
+    def lookup(self, file_path, column):
+        comp, link = self.key(file_path)
+        if not os.path.isfile(self.pack_path(comp)):
+            return None
+        return (
+            self.connection(comp)
+            .execute(
+                f"SELECT {column} FROM files JOIN blobs USING (sha256) WHERE comp = ? AND link = ?",
+                (comp, link),
+            )
+            .fetchone()
+        )
+
+    def exists(self, file_path):
+        return self.lookup(file_path, "1") is not None or super().exists(file_path)
+
+    def read(self, file_path):
+        if file_path in self.streamed_bodies:
+            return super().read(file_path)
+        row = self.lookup(file_path, "data, size")
+        if row is None:
+            return super().read(file_path)
+        return pa.decompress(
+            row[0], decompressed_size=row[1], codec=COMPRESSION, asbytes=True
+        )
+
+    def read_text(self, file_path):
+        return decode_text(self.read(file_path))
+
+    def open_pdf(self, file_path):
+        import fitz
+
+        return fitz.open(stream=self.read(file_path), filetype="pdf")
+
+    def write(self, file_path, body):
+        """Add the body to the pack of its season (unless an identical body is already there) and index it."""
+        comp, link = self.key(file_path)
+        sha = hashlib.sha256(body).hexdigest()
+        conn = self.connection(comp)
+        with conn:
+            if (
+                conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha,)).fetchone()
+                is None
+            ):
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+                    (
+                        sha,
+                        len(body),
+                        pa.compress(body, codec=COMPRESSION, asbytes=True),
+                    ),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (comp, link, sha)
+            )
+
+    def sha256(self, file_path):
+        if file_path in self.streamed_bodies:
+            return super().sha256(file_path)
+        row = self.lookup(file_path, "sha256")
+        return row[0] if row is not None else super().sha256(file_path)
+
+    def stat(self, file_path):
+        row = self.lookup(file_path, "size, sha256")
+        return tuple(row) if row is not None else super().stat(file_path)
+
+    def prune(self):
+        """
+        Delete the blobs that no file refers to anymore (e.g. older versions of updated pages) from every pack, and
+        fold the write-ahead logs into the packs.
+        """
+        deleted = 0
+        if not os.path.isdir(self.archive_path):
+            return deleted
+        for file_name in sorted(os.listdir(self.archive_path)):
+            if not (file_name.startswith("raw_") and file_name.endswith(".sqlite")):
+                continue
+            conn = sqlite3.connect(os.path.join(self.archive_path, file_name))
+            with conn:
+                deleted += conn.execute(
+                    "DELETE FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM files)"
+                ).rowcount
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+        return deleted
+
+
+def open_raw_store(raw_storage, archive_path):
+    """The store of the downloaded files for the RAW_STORAGE setting: loose files or the season packs."""
+    if raw_storage == "files":
+        return FileStore()
+    if raw_storage == "archive":
+        return ArchiveStore(archive_path)
+    raise ValueError(
+        f"Unknown raw storage {raw_storage!r}; expected one of {RAW_STORAGES}"
+    )
+
+
+class AsyncWriter:
+    """
+    Store wrapper that saves the bodies in a background thread, so that the downloads do not wait for the disk. The
+    queue of bodies to save is bounded: once it is full, write blocks until the thread catches up. The bodies that are
+    queued but not saved yet are seen by exists, read and sha256. close waits for the queue to be saved and raises
+    the first error of the thread.
+    """
+
+    def __init__(self, store, maxsize):
+        self.store = store
+        self.queue = queue.Queue(maxsize)
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            file_path, body = item
+            try:
+                self.store.write(file_path, body)
+            except Exception as e:
+                logging.error(f"Error saving {file_path}: {e}")
+                self.error = self.error or e
+            with self.lock:
+                if self.pending.get(file_path) is body:
+                    del self.pending[file_path]
+
+    def write(self, file_path, body):
+        with self.lock:
+            self.pending[file_path] = body
+        self.queue.put((file_path, body))
+
+    def exists(self, file_path):
+        return file_path in self.pending or self.store.exists(file_path)
+
+    def read(self, file_path):
+        with self.lock:
+            body = self.pending.get(file_path)
+        return body if body is not None else self.store.read(file_path)
+
+    def sha256(self, file_path):
+        with self.lock:
+            body = self.pending.get(file_path)
+        if body is not None:
+            return hashlib.sha256(body).hexdigest()
+        return self.store.sha256(file_path)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
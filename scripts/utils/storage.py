@@ -0,0 +1,254 @@
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# string columns repeated on many rows; stored dictionary-encoded in Parquet
+DICTIONARY_COLUMNS = (
+    "element",
+    "judge_id",
+    "nation",
+    "Nation",
+    "category",
+    "component",
+    "source",
+    "comp",
+    "comp_type",
+    "discipline",
+    "program",
+    "Function",
+)
+
+PARTITION_COLUMNS = ["season", "comp_type", "discipline"]
+
+# the types of the partition columns, as in CLEANED_SCHEMA of step 07 (without it, hive partitioning infers them as
+# unordered categoricals, so that e.g. season >= 2016 fails)
+PARTITIONING = ds.partitioning(
+    pa.schema(
+        [
+            ("season", pa.int16()),
+            ("comp_type", pa.string()),
+            ("discipline", pa.string()),
+        ]
+    ),
+    flavor="hive",
+)
+PARTITION_CATEGORIES = ["comp_type", "discipline"]
+
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def prepare_for_parquet(df):
+    """
+    Make a DataFrame writable to Parquet: object columns mixing strings and numbers (e.g. judge scores with "-"
+    for invalid elements) are stored as strings, and repeated string columns are converted to categoricals so that
+    they are dictionary-encoded.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].dropna()
+        if values.map(type).nunique() > 1:
+            df[col] = df[col].map(lambda x: str(x) if pd.notna(x) else None)
+        if col in DICTIONARY_COLUMNS:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def write_parquet(df, file_path):
+    df = prepare_for_parquet(df)
+    df.to_parquet(file_path, engine="pyarrow", compression="zstd", index=False)
+
+
+def write_table(df, path, output_format):
+    """
+    Write a table to {path}.parquet or {path}.pkl depending on the output format. The readers prefer the Parquet file,
+    so an existing pickle is kept (e.g. the included sample, or for migration); a stale Parquet file is removed when
+    writing a pickle.
+    """
+    if output_format == "parquet":
+        write_parquet(df, path + ".parquet")
+    else:
+        df.to_pickle(path + ".pkl")
+        if os.path.isfile(path + ".parquet"):
+            os.remove(path + ".parquet")
+
+
+def table_file(path):
+    """Return the file backing the table at path ({path}.parquet or {path}.pkl), or None."""
+    for ext in (".parquet", ".pkl"):
+        if os.path.isfile(path + ext):
+            return path + ext
+    return None
+
+
+def table_exists(path):
+    return os.path.isfile(path + ".parquet") or os.path.isfile(path + ".pkl")
+
+
+def read_table(path, columns=None):
+    """
+    Read {path}.parquet, falling back to {path}.pkl written by earlier versions of the pipeline. Dictionary-encoded
+    columns are decoded to plain objects so that the pipeline sees the same dtypes as with the pickles.
+    """
+    if os.path.isfile(path + ".parquet"):
+        df = pd.read_parquet(path + ".parquet", columns=columns)
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+        return df
+    df = pd.read_pickle(path + ".pkl")
+    return df[columns] if columns is not None else df
+
+
+def partition_dir(root, keys):
+    parts = []
+    for col, value in zip(PARTITION_COLUMNS, keys):
+        value = NULL_PARTITION if pd.isna(value) else value
+        parts.append(f"{col}={value}")
+    return os.path.join(root, *parts)
+
+
+def arrow_schema(df):
+    """
+    Arrow schema of a (prepared) DataFrame that stays compatible across files written at different times: columns
+    that are entirely empty are typed as strings instead of null, and all dictionary columns use int32 indices.
+    """
+    fields = []
+    for field in pa.Schema.from_pandas(df, preserve_index=False):
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def remove_competition(root, comp):
+    """Remove the files of one competition from all partitions of a dataset."""
+    pattern = os.path.join(root, *["*"] * len(PARTITION_COLUMNS), f"{comp}.parquet")
+    for file_path in glob.glob(pattern):
+        os.remove(file_path)
+        dir_path = os.path.dirname(file_path)
+        while dir_path != root and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+            dir_path = os.path.dirname(dir_path)
+
+
+def write_partitions(df, root):
+    """Write the rows of a DataFrame into the partitions of a dataset, one file per competition and partition."""
+    df = prepare_for_parquet(df)
+    schema = arrow_schema(df.drop(columns=PARTITION_COLUMNS))
+    for keys, df_part in df.groupby(PARTITION_COLUMNS, dropna=False, observed=True):
+        dir_path = partition_dir(root, keys)
+        os.makedirs(dir_path, exist_ok=True)
+        for comp, df_comp in df_part.groupby("comp", observed=True):
+            # a file only stores the dictionary of the values it uses, not every category of the whole DataFrame
+            df_comp = df_comp.apply(
+                lambda col: (
+                    col.cat.remove_unused_categories()
+                    if isinstance(col.dtype, pd.CategoricalDtype)
+                    else col
+                )
+            )
+            table = pa.Table.from_pandas(
+                df_comp.drop(columns=PARTITION_COLUMNS),
+                schema=schema,
+                preserve_index=False,
+            )
+            pq.write_table(
+                table, os.path.join(dir_path, f"{comp}.parquet"), compression="zstd"
+            )
+
+
+def write_partitioned(df, root):
+    """
+    Write a cleaned table as a Parquet dataset partitioned by season / comp_type / discipline, with one file per
+    competition in each partition: {root}/season=2013/comp_type=wc/discipline=men/wc2014.parquet.
+    """
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    write_partitions(df, root)
+
+
+def replace_competition(df, root, comp):
+    """Replace the files of one competition in a partitioned dataset with the rows of df."""
+    remove_competition(root, comp)
+    if not df.empty:
+        write_partitions(df, root)
+
+
+def write_cleaned(df, name, cleaned_path, output_format):
+    """
+    Write a cleaned table either as a partitioned Parquet dataset or as a single pickle. As in write_table, an existing
+    pickle is kept next to the dataset, which the readers prefer.
+    """
+    if output_format == "parquet":
+        write_partitioned(df, os.path.join(cleaned_path, name))
+    else:
+        df.to_pickle(os.path.join(cleaned_path, f"{name}.pkl"))
+        if os.path.isdir(os.path.join(cleaned_path, name)):
+            shutil.rmtree(os.path.join(cleaned_path, name))
+
+
+def read_cleaned(name, cleaned_path, columns=None, filters=None):
+    """
+    Read a cleaned table. For the Parquet dataset only the requested columns and the partitions matching the filters
+    (e.g. [("season", "==", 2023), ("discipline", "==", "women")]) are read. Falls back to the pickle written by
+    earlier versions of the pipeline.
+    """
+    root = os.path.join(cleaned_path, name)
+    if os.path.isdir(root):
+        df = pd.read_parquet(
+            root, columns=columns, filters=filters, partitioning=PARTITIONING
+        )
+        for col in PARTITION_CATEGORIES:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        return df
+
+    df = pd.read_pickle(os.path.join(cleaned_path, f"{name}.pkl"))
+    for col, op, value in filters or []:
+        if op == "==":
+            df = df[df[col] == value]
+        elif op == "in":
+            df = df[df[col].isin(value)]
+        else:
+            raise ValueError(f"Unsupported filter operator for pickles: {op}")
+    return df[columns] if columns is not None else df
+
+
+def iter_cleaned(name, cleaned_path, batch_size=100_000, columns=None, comps=None):
+    """
+    Read a cleaned table in DataFrames of at most batch_size rows, so that the whole table is never held in memory
+    (except for single-file tables, e.g. the pickles written by earlier versions of the pipeline, which are read at
+    once). Dictionary-encoded columns are decoded to plain objects. With comps, only the rows of these competitions
+    are read.
+    """
+    root = os.path.join(cleaned_path, name)
+    if os.path.isdir(root):
+        dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+        row_filter = ds.field("comp").isin(list(comps)) if comps is not None else None
+        for batch in dataset.to_batches(
+            columns=columns, filter=row_filter, batch_size=batch_size
+        ):
+            df = batch.to_pandas()
+            for col in df.columns:
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype(object)
+            yield df
+        return
+
+    if comps is None:
+        df = read_table(root, columns)
+    else:
+        df = read_table(root)
+        df = df[df["comp"].isin(comps)]
+        df = df[columns] if columns is not None else df
+    for start in range(0, len(df), batch_size):
+        yield df.iloc[start : start + batch_size]
@@ -0,0 +1,103 @@
+import copy
+import logging
+import os
+import queue
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.profiling import measure
+from utils.raw_store import AsyncWriter
+
+DEFAULT_QUEUE_SIZE = 8
+
+
+def stream_downloads(
+    fetcher, jobs, parsers, executor, stage, queue_size=DEFAULT_QUEUE_SIZE
+):
+    """
+    Download the jobs and hand every body straight to its parser, instead of saving the files and reading them back.
+
+    parsers maps the file path of a job to (func, args): func(*args, body) is submitted to the executor (a process
+    pool) as soon as the body is downloaded, with body None if the file was not downloaded (not modified, or skipped
+    with revalidate=False), in which case the parser reads the saved file. The bodies are saved for the archive by a
+    background thread (see utils.raw_store.AsyncWriter). The queues are bounded: at most queue_size bodies wait for a
+    parser, queue_size parsers run and queue_size bodies wait to be saved; when they are full, the downloads wait.
+
+    Returns (results, failures): the result of every parser by file path (the exception if it failed) and the
+    (job, error) pairs of the downloads that failed.
+    """
+    writer = AsyncWriter(fetcher.store, queue_size)
+    fetcher = copy.copy(fetcher)
+    fetcher.store = writer
+    bodies = queue.Queue(queue_size)
+
+    def download(job):
+        body, error = None, None
+        try:
+            with measure(
+                stage,
+                os.path.basename(os.path.dirname(job.file_path)),
+                os.path.basename(job.file_path),
+                threaded=True,
+            ) as row:
+                row["outcome"], body = fetcher.fetch_body(job)
+            return row["outcome"]
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if job.file_path in parsers:
+                bodies.put((job.file_path, body, error))
+
+    results = dict()
+    running = dict()
+
+    def collect(futures):
+        for future in futures:
+            file_path = running.pop(future)
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                logging.error(f"Error parsing {file_path}: {e}")
+                results[file_path] = e
+
+    try:
+        with ThreadPoolExecutor(max_workers=fetcher.workers) as downloads:
+            futures = {downloads.submit(download, job): job for job in jobs}
+            try:
+                for _ in range(sum(job.file_path in parsers for job in jobs)):
+                    file_path, body, error = bodies.get()
+                    if error is not None:
+                        results[file_path] = error
+                        continue
+                    while len(running) >= queue_size:
+                        collect(wait(running, return_when=FIRST_COMPLETED).done)
+                    func, args = parsers[file_path]
+                    running[executor.submit(func, *args, body)] = file_path
+                collect(wait(running).done)
+            finally:
+                # unblock the downloads if the parsers stopped early
+                while not all(future.done() for future in futures):
+                    try:
+                        bodies.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+    finally:
+        writer.close()
+        fetcher.metadata.save()
+
+    outcomes = Counter()
+    failures = []
+    for future, job in futures.items():
+        try:
+            outcomes[future.result()] += 1
+        except Exception as e:
+            logging.error(f"Error downloading {job.url}: {e}")
+            failures.append((job, e))
+    logging.info(
+        "Download outcomes: "
+        + ", ".join(f"{key}: {value}" for key, value in sorted(outcomes.items()))
+        + f", failed: {len(failures)}"
+    )
+
+    return results, failures